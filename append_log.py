@@ -0,0 +1,109 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are serialized
+    fcntl = None
+
+# Single-writer access to aiRecord.txt. Every write takes an exclusive flock
+# on aiRecord.txt.lock (a separate file, so it survives the archive being
+# renamed over). Appends go through group commit: a saver queues its bytes,
+# and whichever saver finds no commit running becomes the leader, writes
+# everything queued so far in one write and one fsync, and hands each waiter
+# its offset. Full rewrites (upload replace, compaction) write a temp file and
+# rename it over the archive under the same lock, so a reader or appender
+# never sees a half-written file.
+
+THREAD_LOCK = threading.Lock()
+
+
+# Function to hold the exclusive write lock of a file
+@contextmanager
+def locked(path):
+    with THREAD_LOCK, open(path + ".lock", "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Function to replace a file's content atomically with the given byte chunks
+def atomic_write(path, chunks):
+    tmp_path = path + ".tmp"
+    with locked(path):
+        with open(tmp_path, "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+
+class PendingWrite:
+    __slots__ = ("data", "offset", "error", "done")
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = None
+        self.error = None
+        self.done = False
+
+
+class AppendLog:
+    def __init__(self, path, on_commit=None):
+        self.path = path
+        self.on_commit = on_commit  # called as on_commit(start, data) under the file lock after each commit
+        self.pending = []
+        self.committing = False
+        self.condition = threading.Condition()
+        self.commits = 0
+
+    # Function to append bytes to the file, batched with concurrent appends; returns their offset
+    def append(self, data):
+        write = PendingWrite(data)
+        with self.condition:
+            self.pending.append(write)
+            while self.committing and not write.done:
+                self.condition.wait()
+            if not write.done:
+                self.committing = True
+                batch, self.pending = self.pending, []
+        if not write.done:
+            try:
+                self.commit(batch)
+            finally:
+                with self.condition:
+                    self.committing = False
+                    self.condition.notify_all()
+        if write.error is not None:
+            raise write.error
+        return write.offset
+
+    # Function to write one batch with a single write and fsync
+    def commit(self, batch):
+        data = b"".join(write.data for write in batch)
+        try:
+            with locked(self.path):
+                with open(self.path, "ab") as file:
+                    start = file.seek(0, os.SEEK_END)
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+                offset = start
+                for write in batch:
+                    write.offset = offset
+                    offset += len(write.data)
+                if self.on_commit:
+                    self.on_commit(start, data)
+            self.commits += 1
+        except Exception as error:
+            for write in batch:
+                write.error = error
+        finally:
+            for write in batch:
+                write.done = True
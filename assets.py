@@ -0,0 +1,60 @@
+import hashlib
+import io
+import os
+import threading
+
+# Display-sized image variants. The page images (lotus, cherry, fivek, note)
+# are full-resolution JPEGs, but they are shown at most DISPLAY_WIDTH pixels
+# wide. Each image is resized and recompressed once (WebP by default) and the
+# result is kept in memory, keyed by a hash of the file content, so reruns
+# send the small variant. Pillow ships with Streamlit; without it the original
+# bytes are served unchanged.
+
+DISPLAY_WIDTH = 705
+QUALITY = 80
+
+
+# Function to resize and recompress image bytes to at most width pixels wide
+def make_variant(data, width, fmt="WEBP", quality=QUALITY):
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    with Image.open(io.BytesIO(data)) as image:
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), Image.LANCZOS)
+        if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format=fmt, quality=quality, optimize=True)
+    variant = output.getvalue()
+    return variant if len(variant) < len(data) else data
+
+
+class AssetCache:
+    def __init__(self, width=DISPLAY_WIDTH, fmt="WEBP"):
+        self.width = width
+        self.fmt = fmt
+        self.digests = {}  # (path, size, mtime) -> content hash, so files are only hashed once
+        self.variants = {}  # (content hash, width, format) -> bytes
+        self.lock = threading.Lock()
+
+    # Function to get the display variant of an image file
+    def get(self, path, width=None):
+        width = width or self.width
+        stat = os.stat(path)
+        file_key = (path, stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            digest = self.digests.get(file_key)
+            variant = self.variants.get((digest, width, self.fmt)) if digest else None
+        if variant is not None:
+            return variant
+        with open(path, "rb") as file:
+            data = file.read()
+        digest = hashlib.sha1(data).hexdigest()
+        variant = make_variant(data, width, self.fmt)
+        with self.lock:
+            self.digests[file_key] = digest
+            self.variants[(digest, width, self.fmt)] = variant
+        return variant
@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from record_store import RecordStore, sort_paragraphs  # noqa: E402
+
+# Headless benchmarks for the record hot paths behind the Streamlit buttons:
+# search (Search / keyword buttons), sort_paragraphs, date lookups
+# (ytDay / toDay / show today) and save_text_to_file (append). The default
+# sizes stop at 100k records, which already takes a few minutes and a few
+# hundred MB; pass --sizes 1000000 to go further on a bigger machine.
+# Synthetic archives are written in the exact
+# "{YYYY-MM-DD:  text}[YYYY:MM:DD]" format the app saves, with mixed
+# Chinese/English bodies.
+#
+#   python benchmarks/bench_records.py --sizes 1000 10000 --output bench.json
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+SAVERS = 8  # threads saving at once in the concurrent save benchmark
+SAVES_PER_SAVER = 10
+CHINESE_TERMS = [
+    "任脉", "督脉", "心经", "小肠", "脾经", "胃", "大肠", "肺", "膀胱", "肾经", "胆经", "肝经",
+    "三焦", "心包", "后背", "小腿", "脚底", "头顶", "经络感觉", "经络按摩", "阴陵泉穴", "然谷",
+    "内关", "耳鸣", "祛湿", "经筋", "晨跑", "感觉", "轻松", "今天", "按揉", "气血", "脾胃",
+]
+CHINESE_FILLER = "的了是在有和我就不人都一上也很到说要去你会着没看好自己这"
+ENGLISH_WORDS = [
+    "meridian", "massage", "morning", "run", "relaxed", "tension", "spleen", "stomach",
+    "the", "and", "felt", "better", "after", "walking", "breathing", "sleep", "qi",
+]
+PUNCTUATION = "，。！？"
+QUERIES = [["胃"], ["脾经"], ["经络按摩"], ["meridian"], ["脾经", "小腿"], ["heartbeat"]]
+END_DATE = date(2025, 5, 14)
+
+
+# Function to make one record body of mixed Chinese and English text
+def make_body(rng):
+    parts = []
+    for _ in range(rng.randint(5, 40)):
+        roll = rng.random()
+        if roll < 0.45:
+            parts.append(rng.choice(CHINESE_TERMS))
+        elif roll < 0.8:
+            parts.append("".join(rng.choices(CHINESE_FILLER, k=rng.randint(2, 8))))
+        elif roll < 0.95:
+            parts.append(" " + " ".join(rng.choices(ENGLISH_WORDS, k=rng.randint(1, 5))) + " ")
+        else:
+            parts.append("\n\n### " + rng.choice(CHINESE_TERMS) + "\n")
+        if rng.random() < 0.3:
+            parts.append(rng.choice(PUNCTUATION))
+    return "".join(parts)
+
+
+# Function to format a record exactly as save_text_to_file does
+def format_record(day, body):
+    return "{" + day.strftime("%Y-%m-%d: ") + f" {body}" + "}" + f"[{day.strftime('%Y:%m:%d')}]"
+
+
+# Function to write a synthetic archive of count records, a few per day up to END_DATE
+def generate_archive(path, count, seed=0):
+    rng = random.Random(seed)
+    days = max(count // 4, 1)
+    start = END_DATE - timedelta(days=days)
+    with open(path, "w", encoding="utf-8") as file:
+        for i in range(count):
+            day = start + timedelta(days=i * days // count)
+            file.write("\n\n" + format_record(day, make_body(rng)))
+
+
+# Function to time fn over a number of runs, in milliseconds
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"min_ms": min(samples), "median_ms": statistics.median(samples), "runs": repeat}, result
+
+
+def bench_size(directory, count, repeat):
+    path = os.path.join(directory, f"aiRecord_{count}.txt")
+    generate_archive(path, count)
+    results = {"records": count, "file_bytes": os.path.getsize(path)}
+
+    results["load_cold"], store = timed(lambda: RecordStore(path, path + ".cold.idx"), 1)
+    results["load_saved_index"], store = timed(lambda: RecordStore(path, path + ".cold.idx"), 1)
+
+    searches = {}
+    for keywords in QUERIES:
+        timing, hits = timed(lambda: store.search(keywords), repeat)
+        timing["hits"] = len(hits)
+        searches[" ".join(keywords)] = timing
+        ranked, _ = timed(lambda: store.search_ranked(keywords, 50), repeat)
+        searches[" ".join(keywords) + " (bm25 top 50)"] = ranked
+    results["search_keywords_in_file"] = searches
+
+    hits = store.search(["脾经"])
+    results["sort_paragraphs"], _ = timed(lambda: sort_paragraphs(hits), repeat)
+    results["sort_paragraphs"]["records"] = len(hits)
+
+    target = datetime.combine(END_DATE - timedelta(days=1), datetime.min.time())
+    results["get_paragraphs_by_date"], _ = timed(lambda: store.by_date(target), repeat)
+    results["get_paragraphs_by_date_range_30d"], _ = timed(
+        lambda: store.by_date_range(target - timedelta(days=29), target), repeat
+    )
+
+    results["tail_4000_chars"], _ = timed(lambda: store.tail(4000), repeat)
+    results["tail_10_records"], _ = timed(lambda: store.tail_records(10), repeat)
+
+    rng = random.Random(1)
+    results["save_text_to_file"], _ = timed(
+        lambda: store.append(format_record(END_DATE, make_body(rng))), repeat
+    )
+    bodies = [format_record(END_DATE, make_body(rng)) for _ in range(SAVERS * SAVES_PER_SAVER)]
+    commits = store.log.commits
+    results["save_concurrent"], _ = timed(lambda: concurrent_saves(store, bodies), 1)
+    results["save_concurrent"].update({"saves": len(bodies), "commits": store.log.commits - commits})
+    return results
+
+
+# Function to save records from several threads at once, like tabs saving together
+def concurrent_saves(store, bodies):
+    threads = [
+        threading.Thread(target=lambda part=bodies[i::SAVERS]: [store.append(body) for body in part])
+        for i in range(SAVERS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the aiRecord record hot paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="archive sizes in records")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per timed operation")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file to write")
+    args = parser.parse_args(argv)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": [],
+    }
+    directory = tempfile.mkdtemp(prefix="airecord_bench_")
+    try:
+        for count in args.sizes:
+            print(f"benchmarking {count} records...", file=sys.stderr)
+            report["sizes"].append(bench_size(directory, count, args.repeat))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
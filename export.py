@@ -0,0 +1,46 @@
+import gzip
+import io
+import zipfile
+
+# Archive exports for the download button. The text is produced record by
+# record (or chunk by chunk for the whole text file) from the store and fed
+# straight into the compressor, so the only full copy held is the compressed
+# output of the selected slice: the whole archive, a date range or the
+# current search results.
+
+FORMATS = {
+    "txt": ("aiRecord.txt", "text/plain"),
+    "gzip": ("aiRecord.txt.gz", "application/gzip"),
+    "zip": ("aiRecord.zip", "application/zip"),
+}
+
+
+# Function to yield the exported text of a slice as str chunks
+def iter_export_text(store, start=None, end=None, records=None):
+    if records is not None:
+        for record in records:
+            yield "\n\n" + record.text()
+    elif start is not None and end is not None:
+        for record in store.by_date_range(start, end):
+            yield "\n\n" + record.text()
+    else:
+        yield from store.iter_text()
+
+
+# Function to encode text chunks in the chosen format; returns (bytes, file name, mime type)
+def export_bytes(chunks, fmt="gzip"):
+    file_name, mime = FORMATS[fmt]
+    output = io.BytesIO()
+    if fmt == "gzip":
+        with gzip.GzipFile(filename="aiRecord.txt", mode="wb", fileobj=output) as compressed:
+            for chunk in chunks:
+                compressed.write(chunk.encode("utf-8"))
+    elif fmt == "zip":
+        with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            with archive.open("aiRecord.txt", "w") as member:
+                for chunk in chunks:
+                    member.write(chunk.encode("utf-8"))
+    else:
+        for chunk in chunks:
+            output.write(chunk.encode("utf-8"))
+    return output.getvalue(), file_name, mime
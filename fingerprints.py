@@ -0,0 +1,253 @@
+import argparse
+import os
+import struct
+import threading
+
+from append_log import locked
+from record_store import content_fingerprint, file_state, iter_stream_records
+
+# Duplicate detection for saves. Every record body is reduced to a content
+# fingerprint (record_store.content_fingerprint: sha1 of the lowercased,
+# whitespace-normalized body), and the set of fingerprints is kept in memory
+# for O(1) checks and on disk in aiRecord.txt.fp: a 16-byte header with the
+# archive size and mtime it matches, then one 20-byte digest per record. New
+# fingerprints are appended; if the header no longer matches the archive the
+# set is rebuilt in one streaming pass. Uploads are merged through the set
+# in batches, one append per batch. The compact command rewrites the archive
+# without its duplicate records.
+#
+#   python fingerprints.py compact aiRecord.txt
+
+HEADER = struct.Struct("<qq")
+DIGEST_SIZE = 20
+MERGE_BATCH_BYTES = 1024 * 1024  # upload text appended per write when merging
+SEPARATOR = b"\n\n"  # the blank line written before every saved record
+STALE_KEY = (-1, -1)  # matches no archive state
+
+
+class FingerprintSet:
+    def __init__(self, digests=(), path=None, key=None):
+        self.digests = set(digests)
+        self.path = path
+        self.key = key  # the archive state the set matches
+        self.writing = 0  # saves between claiming a fingerprint and writing their record
+        self.lock = threading.Lock()
+
+    def __contains__(self, digest):
+        return digest in self.digests
+
+    def __len__(self):
+        return len(self.digests)
+
+    # Function to add a fingerprint; returns False if it was already there
+    def add(self, digest):
+        return self.add_many([digest])[0]
+
+    # Function to add fingerprints with one write to the saved set; returns,
+    # for each, True if it was new (a repeat within digests is not)
+    def add_many(self, digests):
+        with self.lock:
+            new = []
+            for digest in digests:
+                new.append(digest not in self.digests)
+                self.digests.add(digest)
+            if self.path and any(new):
+                with open(self.path, "ab") as file:
+                    file.write(b"".join(digest for digest, is_new in zip(digests, new) if is_new))
+        return new
+
+    # Function to claim a fingerprint for a save; returns False if it is already
+    # taken. Until finish_write, the set is not checked against the archive,
+    # since the archive changes under it while the record is written.
+    def begin_write(self, digest):
+        with self.lock:
+            if digest in self.digests:
+                return False
+            self.writing += 1
+        if not self.add(digest):
+            with self.lock:
+                self.writing -= 1
+            return False
+        return True
+
+    # Function to start a write that claims its fingerprints with add_many, like a merge
+    def begin_merge(self):
+        with self.lock:
+            self.writing += 1
+
+    # Function to end a save, marking the archive state once no save is in flight
+    def finish_write(self, key):
+        with self.lock:
+            self.writing -= 1
+            idle = not self.writing
+        if idle:
+            self.mark(key)
+
+    # Function to take back a fingerprint whose record was not written. The
+    # saved copy already holds it, so it is marked stale to be rebuilt.
+    def discard(self, digest):
+        with self.lock:
+            self.digests.discard(digest)
+        self.abort_write()
+
+    # Function to end a write that failed part way; the set is marked stale,
+    # so it is rebuilt from the archive on next use
+    def abort_write(self):
+        with self.lock:
+            self.writing -= 1
+        self.mark(STALE_KEY)
+
+    # Function to tell if the set matches the archive state key
+    def is_current(self, key):
+        return self.writing > 0 or self.key == key
+
+    # Function to record which archive state the saved set matches
+    def mark(self, key):
+        self.key = key
+        if not self.path:
+            return
+        with self.lock, open(self.path, "r+b") as file:
+            file.write(HEADER.pack(*key))
+
+    # Function to write the whole set to path, matching archive state key
+    def save(self, path, key):
+        tmp_path = path + ".tmp"
+        with self.lock:
+            with open(tmp_path, "wb") as file:
+                file.write(HEADER.pack(*key))
+                file.write(b"".join(self.digests))
+            os.replace(tmp_path, path)
+            self.path = path
+            self.key = key
+
+    # Function to read a saved set; returns (set, key) or (None, None)
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None, None
+        if len(data) < HEADER.size or (len(data) - HEADER.size) % DIGEST_SIZE:
+            return None, None
+        key = HEADER.unpack_from(data)
+        digests = (data[i:i + DIGEST_SIZE] for i in range(HEADER.size, len(data), DIGEST_SIZE))
+        return cls(digests, path, key), key
+
+
+# Function to fingerprint every record of a binary stream in one pass
+def scan_fingerprints(stream):
+    return FingerprintSet(content_fingerprint(record.body) for record in iter_stream_records(stream))
+
+
+# Function to get the fingerprint set of a text archive, from fp_path when it
+# still matches the archive, otherwise by one streaming pass (saved for next time)
+def load_or_build(text_path, fp_path=None):
+    fp_path = fp_path or text_path + ".fp"
+    key = file_state(text_path)
+    fingerprints, saved_key = FingerprintSet.load(fp_path)
+    if fingerprints is not None and saved_key == key:
+        return fingerprints
+    try:
+        with open(text_path, "rb") as file:
+            fingerprints = scan_fingerprints(file)
+    except FileNotFoundError:
+        fingerprints = FingerprintSet()
+    fingerprints.key = key
+    try:
+        fingerprints.save(fp_path, key)
+    except OSError:
+        pass  # read-only deploys keep the set in memory only
+    return fingerprints
+
+
+# Function to merge records streamed from an upload into a store, skipping
+# ones already present by content. New records are appended a batch at a
+# time, each batch in one store.append, so every index is updated in place.
+# A saved fingerprint set can be passed in to skip fingerprinting the store;
+# bracket the call with its begin_merge and finish_write. Returns (added, skipped).
+def merge_stream(store, stream, seen=None):
+    if seen is None:
+        seen = FingerprintSet(content_fingerprint(record.body) for record in store.iter_records())
+    added = skipped = 0
+    batch = []
+    size = 0
+    for record in iter_stream_records(stream):
+        batch.append(record)
+        size += record.length
+        if size >= MERGE_BATCH_BYTES:
+            count = append_new(store, batch, seen)
+            added += count
+            skipped += len(batch) - count
+            batch = []
+            size = 0
+    count = append_new(store, batch, seen)
+    return added + count, skipped + len(batch) - count
+
+
+# Function to append the records of a batch that seen does not have yet, in one write
+def append_new(store, records, seen):
+    new = seen.add_many([content_fingerprint(record.body) for record in records])
+    texts = [record.text() for record, is_new in zip(records, new) if is_new]
+    if texts:
+        store.append("\n\n".join(texts))
+    return len(texts)
+
+
+# Function to rewrite a text archive without duplicate records, keeping the
+# first copy of each and every byte outside records (a duplicate's blank-line
+# separator goes with it, free text before it stays). Streams the file,
+# writes a temp file and renames it over the original under the archive's write
+# lock, so no save is lost in between; returns (kept, removed).
+def compact(text_path):
+    with locked(text_path):
+        return compact_locked(text_path)
+
+
+def compact_locked(text_path):
+    tmp_path = text_path + ".compact"
+    seen = set()
+    kept = removed = 0
+    with open(text_path, "rb") as records_file, open(text_path, "rb") as source, open(tmp_path, "wb") as output:
+        position = 0
+        for record in iter_stream_records(records_file):
+            gap = source.read(record.offset - position)
+            chunk = source.read(record.length)
+            position = record.offset + record.length
+            fingerprint = content_fingerprint(record.body)
+            if fingerprint in seen:
+                output.write(gap[:-len(SEPARATOR)] if gap.endswith(SEPARATOR) else gap)
+                removed += 1
+                continue
+            seen.add(fingerprint)
+            output.write(gap + chunk)
+            kept += 1
+        while True:
+            chunk = source.read(64 * 1024)
+            if not chunk:
+                break
+            output.write(chunk)
+        output.flush()
+        os.fsync(output.fileno())
+    os.replace(tmp_path, text_path)
+    FingerprintSet(seen).save(text_path + ".fp", file_state(text_path))
+    return kept, removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find and remove duplicate aiRecord records.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="write the fingerprint set of an archive")
+    build_parser.add_argument("text_path")
+    compact_parser = commands.add_parser("compact", help="rewrite an archive without duplicate records")
+    compact_parser.add_argument("text_path")
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        print(f"{len(load_or_build(args.text_path))} distinct records")
+    else:
+        kept, removed = compact(args.text_path)
+        print(f"kept {kept} records, removed {removed} duplicates")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import re
+from functools import lru_cache
+
+# Keyword highlighting for search results. All keywords of a query go into
+# one case-insensitive alternation, compiled once per query, so a record is
+# highlighted in a single pass. Results keep the plain text next to the
+# highlighted HTML, so nothing ever has to strip the tags back out.
+
+HIGHLIGHT_COLOR = "#efd06c"  # Change this to match your theme
+HIGHLIGHT_OPEN = (
+    f'<span style="background-color: {HIGHLIGHT_COLOR}; color: black; '
+    'font-weight: bold; padding: 2px 4px; border-radius: 3px;">'
+)
+HIGHLIGHT_CLOSE = "</span>"
+
+
+class Hit:
+    __slots__ = ("plain", "html")
+
+    def __init__(self, plain, html=None):
+        self.plain = plain
+        self.html = plain if html is None else html
+
+
+# Function to compile one pattern for a query; longest keywords first so
+# overlapping keywords highlight the longer match
+@lru_cache(maxsize=256)
+def keyword_pattern(keywords):
+    alternatives = sorted({kw for kw in keywords if kw}, key=len, reverse=True)
+    if not alternatives:
+        return None
+    return re.compile("|".join(re.escape(kw) for kw in alternatives), re.IGNORECASE)
+
+
+# Function to wrap every keyword occurrence in a highlight span
+def highlight(text, keywords):
+    pattern = keyword_pattern(tuple(keywords))
+    if pattern is None:
+        return text
+    return pattern.sub(lambda match: HIGHLIGHT_OPEN + match.group(0) + HIGHLIGHT_CLOSE, text)
+
+
+# Function to build a search hit holding both forms of a paragraph
+def make_hit(paragraph, keywords):
+    return Hit(paragraph, highlight(paragraph, keywords))
@@ -0,0 +1,98 @@
+import threading
+from collections import deque
+
+from search_index import normalize_text
+
+# Hit counts for the saved sidebar keywords (keywords.txt). All keywords are
+# matched together by one Aho-Corasick automaton, so every record is scanned
+# once no matter how many keywords there are. The matching records are kept
+# per keyword, so a keyword button serves its list without searching again,
+# and records saved since are counted by catching up from the store.
+# Keywords and records are matched like Search does: ignoring case, with any
+# run of whitespace matching a space.
+
+
+class AhoCorasick:
+    def __init__(self, keywords):
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        for keyword in keywords:
+            self.insert(keyword)
+        self.link()
+
+    def insert(self, keyword):
+        node = 0
+        for char in keyword:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            node = next_node
+        self.outputs[node].append(keyword)
+
+    # Function to set the failure links breadth first and merge outputs along them
+    def link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+
+    # Function to get the set of keywords that occur in text
+    def find_all(self, text):
+        found = set()
+        node = 0
+        goto = self.goto
+        fail = self.fail
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if self.outputs[node]:
+                found.update(self.outputs[node])
+        return found
+
+
+class KeywordCounter:
+    def __init__(self, keywords, records=()):
+        self.keywords = [kw for kw in dict.fromkeys(keywords) if kw.strip()]
+        self.lowered = {}
+        for kw in self.keywords:
+            self.lowered.setdefault(normalize_text(kw), []).append(kw)
+        self.automaton = AhoCorasick(self.lowered)
+        self.hits = {kw: [] for kw in self.keywords}
+        self.record_count = 0
+        self.version = None  # (store, store generation) the counts were built from, set by the app
+        self.lock = threading.RLock()
+        for record in records:
+            self.add(record)
+
+    # Function to count one record
+    def add(self, record):
+        with self.lock:
+            for lowered in self.automaton.find_all(normalize_text(record.body)):
+                for kw in self.lowered[lowered]:
+                    self.hits[kw].append(record)
+            self.record_count += 1
+
+    # Function to count the records the store gained after the ones already counted
+    def catch_up(self, store):
+        with self.lock:
+            for record in store.records_from(self.record_count):
+                self.add(record)
+
+    def count(self, keyword):
+        return len(self.hits.get(keyword, ()))
+
+    # Function to get the records containing a keyword, without searching
+    def records_for(self, keyword):
+        return list(self.hits.get(keyword, ()))
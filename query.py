@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from keyword_counts import KeywordCounter
+from record_store import sort_paragraphs
+from segments import segment_name
+from storage import BACKENDS, open_store
+
+# Headless access to the record archive, without the Streamlit UI. The same
+# store, indexes and ordering the app uses answer keyword searches, date
+# ranges, recent records and batch keyword counts, either from the command
+# line or from a small local HTTP server. Results stream as JSON lines.
+#
+#   python query.py search 脾经 小腿 --ranked --limit 10
+#   python query.py dates 2025-04-01 2025-04-30
+#   python query.py recent 5
+#   python query.py counts --by month
+#   python query.py serve --port 8765
+#   curl "http://127.0.0.1:8765/search?q=脾经+小腿"
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FILE_PATH = os.path.join(HERE, "aiRecord.txt")
+KEYWORDS_PATH = os.path.join(HERE, "keywords.txt")
+
+
+# Function to turn a record into a JSON-ready dict
+def record_json(record):
+    return {"date": record.date, "offset": record.offset, "body": record.body}
+
+
+# Function to parse a YYYY-MM-DD date argument
+def parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+# Function to find the records containing all keywords, newest first or best first like the app
+def search(store, keywords, ranked=False, limit=None):
+    if ranked:
+        return store.search_ranked(keywords, limit or 50)
+    results = sort_paragraphs(store.search(keywords))
+    return results[:limit] if limit else results
+
+
+def dates(store, start, end=None):
+    return store.by_date_range(parse_day(start), parse_day(end or start))
+
+
+def recent(store, n):
+    return store.tail_records(n)
+
+
+# Function to yield the hit count of every keyword, overall or per month, in one pass over the archive
+def keyword_counts(store, keywords, by=None):
+    counter = KeywordCounter(keywords, store.iter_records())
+    for keyword in counter.keywords:
+        if by != "month":
+            yield {"keyword": keyword, "count": counter.count(keyword)}
+            continue
+        months = {}
+        for record in counter.records_for(keyword):
+            month = segment_name(record.date)
+            months[month] = months.get(month, 0) + 1
+        for month in sorted(months):
+            yield {"keyword": keyword, "month": month, "count": months[month]}
+
+
+# Function to read the saved sidebar keywords
+def load_keywords(path=KEYWORDS_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return [line.strip() for line in file if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+# Function to run one query by name; yields JSON-ready dicts
+def run_query(store, name, params):
+    if name == "search":
+        records = search(store, params["keywords"], params.get("ranked", False), params.get("limit"))
+    elif name == "dates":
+        records = dates(store, params["start"], params.get("end"))
+    elif name == "recent":
+        records = recent(store, params.get("n", 10))
+    elif name == "counts":
+        keywords = params.get("keywords") or load_keywords(params.get("keywords_path", KEYWORDS_PATH))
+        yield from keyword_counts(store, keywords, params.get("by"))
+        return
+    else:
+        raise ValueError(f"unknown query {name!r}")
+    for record in records:
+        yield record_json(record)
+
+
+# Function to write query results as JSON lines
+def write_lines(rows, output):
+    for row in rows:
+        output.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    store = None  # set by serve()
+
+    # Function to answer GET /search?q=..&ranked=1&limit=.., /dates?start=..&end=..,
+    # /recent?n=.. and /counts?by=month with streamed JSON lines
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        name = url.path.strip("/")
+        try:
+            params = {
+                "keywords": query["keywords"].split(",") if query.get("keywords") else query.get("q", "").split(),
+                "ranked": query.get("ranked") == "1",
+                "limit": int(query["limit"]) if query.get("limit") else None,
+                "start": query.get("start"),
+                "end": query.get("end"),
+                "n": int(query.get("n", 10)),
+                "by": query.get("by"),
+            }
+            self.store.refresh()
+            rows = run_query(self.store, name, params)
+            first = next(rows, None)
+        except (KeyError, TypeError, ValueError) as error:
+            self.send_json_error(400, str(error))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.end_headers()
+        if first is not None:
+            self.wfile.write((json.dumps(first, ensure_ascii=False) + "\n").encode("utf-8"))
+        for row in rows:
+            self.wfile.write((json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def send_json_error(self, status, message):
+        body = json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Function to serve queries over HTTP on the local machine until interrupted
+def serve(store, host="127.0.0.1", port=8765):
+    QueryHandler.store = store
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    print(f"serving aiRecord queries on http://{host}:{port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the aiRecord archive without the UI; prints JSON lines.")
+    parser.add_argument("--backend", choices=BACKENDS, default=os.environ.get("AIRECORD_BACKEND", "text"))
+    parser.add_argument("--file", default=FILE_PATH, help="aiRecord.txt path")
+    parser.add_argument("--db", default=os.environ.get("AIRECORD_DB"), help="SQLite database path")
+    parser.add_argument("--segments", default=os.environ.get("AIRECORD_SEGMENTS"), help="monthly segments directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    search_parser = commands.add_parser("search", help="records containing all keywords")
+    search_parser.add_argument("keywords", nargs="+")
+    search_parser.add_argument("--ranked", action="store_true", help="order by BM25 relevance instead of date")
+    search_parser.add_argument("--limit", type=int)
+    dates_parser = commands.add_parser("dates", help="records stamped from start to end (YYYY-MM-DD)")
+    dates_parser.add_argument("start")
+    dates_parser.add_argument("end", nargs="?")
+    recent_parser = commands.add_parser("recent", help="the last n records of the archive")
+    recent_parser.add_argument("n", type=int, nargs="?", default=10)
+    counts_parser = commands.add_parser("counts", help="hit counts of the saved keywords")
+    counts_parser.add_argument("--by", choices=["month"], help="count per month")
+    counts_parser.add_argument("--keywords-path", default=KEYWORDS_PATH)
+    counts_parser.add_argument("--keyword", action="append", dest="keyword_list", help="count these instead")
+    serve_parser = commands.add_parser("serve", help="answer the same queries over HTTP")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+    for day in (getattr(args, "start", None), getattr(args, "end", None)):
+        try:
+            if day:
+                parse_day(day)
+        except ValueError:
+            parser.error(f"invalid date {day!r}, expected YYYY-MM-DD")
+    store = open_store(args.backend, args.file, args.db, args.segments)
+    if args.command == "serve":
+        serve(store, args.host, args.port)
+        return
+    params = {
+        "keywords": getattr(args, "keyword_list", None) or getattr(args, "keywords", None),
+        "ranked": getattr(args, "ranked", False),
+        "limit": getattr(args, "limit", None),
+        "start": getattr(args, "start", None),
+        "end": getattr(args, "end", None),
+        "n": getattr(args, "n", 10),
+        "by": getattr(args, "by", None),
+        "keywords_path": getattr(args, "keywords_path", KEYWORDS_PATH),
+    }
+    try:
+        write_lines(run_query(store, args.command, params), sys.stdout)
+    except BrokenPipeError:
+        # the reader stopped early (e.g. piped into head); silence the flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+if __name__ == "__main__":
+    main()
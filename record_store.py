@@ -0,0 +1,297 @@
+import bisect
+import hashlib
+import os
+import re
+import threading
+
+import search_index
+from append_log import AppendLog
+
+# Parse-once store for the records of aiRecord.txt.
+# Records look like "{YYYY-MM-DD:  text}[YYYY:MM:DD]" and are separated by a
+# blank line. The file is scanned as bytes so every record knows its byte
+# offset and length in the file; "{" never appears inside a multi-byte UTF-8
+# character, so the byte pattern finds the same records as the text one.
+
+RECORD_PATTERN = re.compile(rb"\{(.*?)\}\s*\[(\d{4}:\d{2}:\d{2})\]", re.DOTALL)
+RECORD_END = re.compile(rb"\}\s*\[\d{4}:\d{2}:\d{2}\]")
+UTF8_CONTINUATION = bytes(range(0x80, 0xC0))
+TAIL_BLOCK = 8 * 1024
+
+
+class Record:
+    __slots__ = ("date", "offset", "length", "body")
+
+    def __init__(self, date, offset, length, body):
+        self.date = date  # "YYYY:MM:DD" stamp, sorts like the date itself
+        self.offset = offset
+        self.length = length
+        self.body = body
+
+    # Function to render the record the way search results show it
+    def paragraph(self):
+        return "{" + self.body + "} [" + self.date + "]"
+
+    # Function to render the record exactly as it is stored in aiRecord.txt
+    def text(self):
+        return "{" + self.body + "}[" + self.date + "]"
+
+
+# Function to get the size and mtime a store or index is keyed on
+def file_state(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return (0, 0)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+# Function to parse raw file bytes into records
+def parse_records(data, base_offset=0):
+    records = []
+    for match in RECORD_PATTERN.finditer(data):
+        records.append(Record(
+            match.group(2).decode("ascii"),
+            base_offset + match.start(),
+            match.end() - match.start(),
+            match.group(1).decode("utf-8", errors="replace"),
+        ))
+    return records
+
+
+# Function to parse records from a binary stream one at a time, holding at most
+# one record's worth of bytes. A match can be emitted as soon as it is in the
+# buffer: more data can only add later records, never change an earlier one.
+def iter_stream_records(stream, chunk_size=64 * 1024):
+    buffer = b""
+    offset = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        buffer += chunk
+        consumed = 0
+        for record in parse_records(buffer, offset):
+            consumed = record.offset + record.length - offset
+            yield record
+        if not chunk:
+            return
+        start = buffer.find(b"{", consumed)
+        keep = start if start != -1 else len(buffer)
+        buffer = buffer[keep:]
+        offset += keep
+
+
+# Function to split archive bytes into its records and the bytes around them:
+# gaps[i] is what comes before records[i], gaps[-1] what follows the last one
+def split_gaps(data):
+    records = parse_records(data)
+    gaps = []
+    position = 0
+    for record in records:
+        gaps.append(data[position:record.offset])
+        position = record.offset + record.length
+    gaps.append(data[position:])
+    return records, gaps
+
+
+# Function to yield the blocks of a binary file from the end backwards, as (offset, bytes)
+def iter_reverse_blocks(file, block_size=TAIL_BLOCK):
+    position = file.seek(0, os.SEEK_END)
+    while position > 0:
+        start = max(0, position - block_size)
+        file.seek(start)
+        yield start, file.read(position - start)
+        position = start
+
+
+# Function to get the last n characters of a UTF-8 file. A character takes at
+# most 4 bytes, so only the last 4n bytes are read; the bytes of a character
+# cut in half by the seek are dropped before decoding.
+def tail_text(path, n):
+    if n <= 0:
+        return ""
+    try:
+        with open(path, "rb") as file:
+            size = file.seek(0, os.SEEK_END)
+            start = max(0, size - 4 * n)
+            file.seek(start)
+            data = file.read()
+    except FileNotFoundError:
+        return ""
+    if start:
+        data = data.lstrip(UTF8_CONTINUATION)
+    return data.decode("utf-8", errors="replace")[-n:]
+
+
+# Function to get the last n whole records of a file, reading blocks from the
+# end until n records follow a record end. Every "}[YYYY:MM:DD]" closes a
+# record, so parsing from just after one finds the same records a full parse does.
+def tail_records(path, n, block_size=TAIL_BLOCK):
+    if n <= 0:
+        return []
+    data = b""
+    try:
+        with open(path, "rb") as file:
+            for start, block in iter_reverse_blocks(file, block_size):
+                data = block + data
+                if start == 0:
+                    return parse_records(data)[-n:]
+                boundary = RECORD_END.search(data)
+                if boundary:
+                    records = parse_records(data[boundary.end():], start + boundary.end())
+                    if len(records) >= n:
+                        return records[-n:]
+    except FileNotFoundError:
+        pass
+    return parse_records(data)[-n:]
+
+
+# Function to fingerprint a record body, ignoring case and whitespace differences
+def content_fingerprint(body):
+    return hashlib.sha1(" ".join(body.lower().split()).encode("utf-8")).digest()
+
+
+# Function to format a date or datetime as a record stamp
+def date_stamp(value):
+    return value.strftime("%Y:%m:%d")
+
+
+# Function to sort paragraphs (records) newest first, longest first within a day
+def sort_paragraphs(paragraphs):
+    return sorted(paragraphs, key=lambda record: (record.date, record.length), reverse=True)
+
+
+# Sorted date -> record id index. Stamps are fixed-width "YYYY:MM:DD" strings,
+# so plain string order is date order and no strptime is needed.
+class DateIndex:
+    def __init__(self, records=()):
+        pairs = sorted((record.date, record_id) for record_id, record in enumerate(records))
+        self.dates = [date for date, _ in pairs]
+        self.ids = [record_id for _, record_id in pairs]
+
+    def add(self, date, record_id):
+        position = bisect.bisect_right(self.dates, date)
+        self.dates.insert(position, date)
+        self.ids.insert(position, record_id)
+
+    # Function to get the record ids stamped from start to end, both inclusive
+    def range(self, start, end):
+        low = bisect.bisect_left(self.dates, start)
+        high = bisect.bisect_right(self.dates, end)
+        return self.ids[low:high]
+
+
+class RecordStore:
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + ".idx"
+        self.records = []
+        self.index = None
+        self.dates = DateIndex()
+        self.state = (0, 0)
+        self.generation = 0  # bumped on every full load; appends keep earlier records in place
+        self.lock = threading.RLock()
+        self.log = AppendLog(path, self.index_commit)
+        self.load()
+
+    def load(self):
+        self.state = file_state(self.path)
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            data = b""
+        self.records = parse_records(data)
+        self.index = search_index.load_or_build(
+            self.index_path, self.state, [record.body for record in self.records],
+            data, [record.offset + record.length for record in self.records],
+        )
+        self.dates = DateIndex(self.records)
+        self.generation += 1
+
+    def count(self):
+        return len(self.records)
+
+    def iter_records(self):
+        return iter(list(self.records))
+
+    # Function to get the records from position start on, in file order
+    def records_from(self, start):
+        with self.lock:
+            return self.records[start:]
+
+    # Function to reparse the file if it was changed outside this store
+    def refresh(self):
+        with self.lock:
+            if file_state(self.path) != self.state:
+                self.load()
+
+    # Function to append one formatted record and return its byte offset.
+    # The write goes through the locked append log, batched with concurrent saves.
+    def append(self, record_text):
+        return self.log.append(("\n\n" + record_text).encode("utf-8")) + 2
+
+    # Function to index the bytes the append log just wrote at start. Only the
+    # new records are parsed and indexed, so the cost does not grow with the
+    # archive; if the file grew elsewhere first, it is reloaded instead.
+    def index_commit(self, start, data):
+        with self.lock:
+            if self.state[0] != start:
+                self.load()
+                return
+            for record in parse_records(data, start):
+                self.records.append(record)
+                self.index.add(len(self.records) - 1, record.body)
+                self.dates.add(record.date, len(self.records) - 1)
+            self.state = file_state(self.path)
+
+    # Function to find the records containing all keywords, in file order
+    def search(self, keywords):
+        doc_ids = self.index.lookup(keywords, lambda doc_id: self.records[doc_id].body)
+        return [self.records[doc_id] for doc_id in doc_ids]
+
+    # Function to get the k records most relevant to the keywords, best first
+    def search_ranked(self, keywords, k=50):
+        ranked = self.index.rank(keywords, lambda doc_id: self.records[doc_id].body, k)
+        return [self.records[doc_id] for _, doc_id in ranked]
+
+    # Function to find the records stamped with the given day
+    def by_date(self, day):
+        return self.by_date_range(day, day)
+
+    # Function to find the records stamped from start to end (dates or datetimes, inclusive)
+    def by_date_range(self, start, end):
+        record_ids = self.dates.range(date_stamp(start), date_stamp(end))
+        return [self.records[record_id] for record_id in record_ids]
+
+    # Function to yield the file text in chunks
+    def iter_text(self, chunk_size=64 * 1024):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                while True:
+                    chunk = file.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+        except FileNotFoundError:
+            return
+
+    # Function to get the text before the first blank line of the file
+    def head(self):
+        lines = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if not line.strip("\n"):
+                        break
+                    lines.append(line)
+        except FileNotFoundError:
+            pass
+        return "".join(lines).rstrip("\n")
+
+    # Function to get the last n characters of the file, read from the end
+    def tail(self, n):
+        return tail_text(self.path, n)
+
+    # Function to get the last n records of the file, read from the end
+    def tail_records(self, n):
+        return tail_records(self.path, n)
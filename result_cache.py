@@ -0,0 +1,54 @@
+import threading
+from collections import OrderedDict
+
+# Shared LRU cache for search and date query results. Entries are keyed by
+# the normalized query and tagged with the archive version (its size and
+# mtime, or record count); when the version moves on, e.g. after a save or an
+# upload, all entries are dropped at once instead of being patched. Hit and
+# miss counters are kept so the size can be tuned.
+
+
+# Function to normalize search keywords: all keywords must match, in any order and case
+def normalize_query(keywords):
+    return tuple(sorted({kw.lower() for kw in keywords if kw}))
+
+
+class ResultCache:
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # Function to get the cached result for key at an archive version, computing it on a miss
+    def get(self, key, version, compute):
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return list(result)
+            self.misses += 1
+        result = tuple(compute())
+        with self.lock:
+            if version == self.version:
+                self.entries[key] = result
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return list(result)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,415 @@
+import bisect
+import hashlib
+import heapq
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from itertools import accumulate, groupby
+
+# Inverted index over the records of aiRecord.txt.
+# Most records are Chinese, so instead of splitting on words we index every
+# character 1/2/3-gram of the lowercased text (whitespace breaks the grams).
+# Keywords up to 3 characters are answered straight from their posting list,
+# longer ones by intersecting their trigram posting lists and then checking
+# the few candidates that are left. A keyword with
+# spaces matches across any run of whitespace, as the plain scan did: its
+# parts are looked up one by one and the candidates checked for the phrase.
+# Every posting list has a parallel list of term frequencies, and the index
+# keeps each record's length, so results can also be ranked with BM25.
+#
+# The index lives in a SQLite file (aiRecord.txt.idx) and is read on demand,
+# one posting list per keyword gram, so loading it only reads the record
+# lengths. Records are stored in chunks: each chunk holds, per term, the
+# doc ids as gaps and the frequencies, packed into the narrowest array type
+# that fits. Records appended to the archive become a new chunk, so the file
+# is extended rather than rewritten; once there are more than MAX_CHUNKS the
+# chunks are merged into one.
+
+INDEX_VERSION = 6
+MAX_GRAM = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+FLUSH_DOCS = 5000  # records held in memory before they are written as a chunk
+MAX_CHUNKS = 32
+CACHE_TERMS = 256  # decoded posting lists kept in memory
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT, chunk INTEGER, docs BLOB, freqs BLOB, PRIMARY KEY (term, chunk)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS doc_lengths (chunk INTEGER PRIMARY KEY, lengths BLOB);
+"""
+
+
+# Function to count the index terms of a piece of text
+def tokenize_terms(text):
+    grams = []
+    for run in text.lower().split():
+        grams.extend(run)
+        for n in range(2, MAX_GRAM + 1):
+            grams.extend([run[i:i + n] for i in range(len(run) - n + 1)])
+    return Counter(grams)
+
+
+# Function to get a record's length as BM25 sees it: its non-whitespace characters
+def text_length(text):
+    return sum(len(run) for run in text.split())
+
+
+# Function to lowercase text and collapse its whitespace runs to single spaces
+def normalize_text(text):
+    return " ".join(text.lower().split())
+
+
+# Function to tell if a normalized keyword needs its candidates checked against the text
+def needs_check(keyword):
+    return len(keyword) > MAX_GRAM or " " in keyword
+
+
+# Function to tell if a text contains all normalized keywords, whitespace runs matching a space
+def contains_all(text, keywords):
+    text = normalize_text(text)
+    return all(kw in text for kw in keywords)
+
+
+# Function to rank records that contain all keywords with BM25 and return
+# the top k, best first, for stores without a term index; records come in
+# file order. doc_freqs maps each
+# normalized keyword to the number of records containing it; terms are
+# counted in the whitespace-normalized text, lengths as text_length.
+def rank_records(records, keywords, doc_freqs, doc_count, average_length, k=50):
+    keywords = list(dict.fromkeys(kw for kw in (normalize_text(kw) for kw in keywords) if kw))
+    doc_count = max(doc_count, 1)
+    average_length = average_length or 1
+    weights = {}
+    for kw in keywords:
+        df = doc_freqs.get(kw) or 1
+        weights[kw] = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+
+    def score(record):
+        text = normalize_text(record.body)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * text_length(record.body) / average_length)
+        total = 0.0
+        for kw, weight in weights.items():
+            tf = text.count(kw)
+            total += weight * tf * (BM25_K1 + 1) / (tf + norm)
+        return total
+
+    ranked = heapq.nlargest(k, enumerate(records), key=lambda item: (score(item[1]), item[0]))
+    return [record for _, record in ranked]  # ties go to the later record, as in SearchIndex.rank
+
+
+# Function to fingerprint the indexed part of the file, used to check a saved index still matches it
+def prefix_digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+# Function to pack non-negative ints into the narrowest array type that holds
+# them, prefixed with its type code
+def pack_ints(values):
+    largest = max(values, default=0)
+    typecode = "B" if largest < 1 << 8 else "H" if largest < 1 << 16 else "I"
+    packed = array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return typecode.encode("ascii") + packed.tobytes()
+
+
+def unpack_ints(blob):
+    packed = array(blob[:1].decode("ascii"), blob[1:])
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed
+
+
+# Function to pack the ascending doc ids of a chunk as gaps from its first doc id
+def pack_ids(doc_ids, chunk):
+    return pack_ints([doc_id - previous for previous, doc_id in zip([chunk] + doc_ids, doc_ids)])
+
+
+def unpack_ids(blob, chunk):
+    return list(accumulate(unpack_ints(blob), initial=chunk))[1:]
+
+
+# Function to pack term frequencies; None when every one is 1, as for most grams
+def pack_freqs(freqs):
+    return pack_ints(freqs) if any(count != 1 for count in freqs) else None
+
+
+def unpack_freqs(blob, size):
+    return unpack_ints(blob).tolist() if blob is not None else [1] * size
+
+
+# Function to intersect sorted posting lists, shortest first
+def intersect_postings(lists):
+    if not lists:
+        return []
+    lists = sorted(lists, key=len)
+    result = lists[0]
+    for other in lists[1:]:
+        if not result:
+            break
+        other_set = set(other)
+        result = [doc_id for doc_id in result if doc_id in other_set]
+    return list(result)
+
+
+class SearchIndex:
+    # path is the index file, or ":memory:" to keep the index in memory only
+    def __init__(self, path=":memory:"):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.RLock()
+        self.cache = OrderedDict()  # term -> (doc ids, freqs), recently used last
+        meta = dict(self.connection.execute("SELECT name, value FROM meta"))
+        if meta.get("version") != INDEX_VERSION:
+            self.clear()
+            self.connection.commit()
+            meta = {}
+        self.key = tuple(json.loads(meta["key"])) if "key" in meta else None  # the file state it was saved for
+        self.prefix_length = meta.get("prefix_length", 0)  # bytes of the file covered by the indexed records
+        self.prefix_digest = meta.get("prefix_digest", prefix_digest(b""))
+        self.doc_lengths = array("I")
+        for (lengths,) in self.connection.execute("SELECT lengths FROM doc_lengths ORDER BY chunk"):
+            self.doc_lengths.fromlist(unpack_ints(lengths).tolist())
+        self.total_length = sum(self.doc_lengths)
+        self.doc_count = len(self.doc_lengths)
+        self.flushed = self.doc_count  # records written to the file; the rest are in pending
+        self.pending = {}  # term -> (doc ids, freqs) of the records added since the last flush
+
+    # Function to drop every record from the index
+    def clear(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM meta")
+            self.connection.execute("DELETE FROM postings")
+            self.connection.execute("DELETE FROM doc_lengths")
+            self.cache.clear()
+            self.key = None
+            self.prefix_length = 0
+            self.prefix_digest = prefix_digest(b"")
+            self.doc_lengths = array("I")
+            self.total_length = 0
+            self.doc_count = 0
+            self.flushed = 0
+            self.pending = {}
+
+    # Function to add one record; doc ids must be added in increasing order
+    def add(self, doc_id, text):
+        with self.lock:
+            pending = self.pending
+            for term, count in tokenize_terms(text).items():
+                entry = pending.get(term)
+                if entry is None:
+                    pending[term] = ([doc_id], [count])
+                else:
+                    entry[0].append(doc_id)
+                    entry[1].append(count)
+            length = text_length(text)
+            self.doc_lengths.append(length)
+            self.total_length += length
+            self.doc_count = doc_id + 1
+            self.cache.clear()
+
+    # Function to write the pending records to the file as one chunk
+    def flush(self):
+        with self.lock:
+            if self.flushed == self.doc_count:
+                return
+            chunk = self.flushed
+            self.connection.executemany(
+                "INSERT INTO postings (term, chunk, docs, freqs) VALUES (?, ?, ?, ?)",
+                ((term, chunk, pack_ids(doc_ids, chunk), pack_freqs(freqs)) for term, (doc_ids, freqs) in self.pending.items()),
+            )
+            self.connection.execute(
+                "INSERT INTO doc_lengths (chunk, lengths) VALUES (?, ?)", (chunk, pack_ints(self.doc_lengths[chunk:]))
+            )
+            self.pending = {}
+            self.flushed = self.doc_count
+
+    # Function to merge all chunks into one once there are more than MAX_CHUNKS.
+    # Terms are streamed in order, so memory stays flat.
+    def merge_chunks(self):
+        with self.lock:
+            if self.connection.execute("SELECT count(*) FROM doc_lengths").fetchone()[0] <= MAX_CHUNKS:
+                return False
+            self.connection.execute("CREATE TEMP TABLE merged (term TEXT PRIMARY KEY, docs BLOB, freqs BLOB) WITHOUT ROWID")
+            rows = self.connection.execute("SELECT term, chunk, docs, freqs FROM postings ORDER BY term, chunk")
+            for term, group in groupby(rows, key=lambda row: row[0]):
+                doc_ids = []
+                freqs = []
+                for _, chunk, docs, counts in group:
+                    chunk_ids = unpack_ids(docs, chunk)
+                    doc_ids.extend(chunk_ids)
+                    freqs.extend(unpack_freqs(counts, len(chunk_ids)))
+                self.connection.execute(
+                    "INSERT INTO merged VALUES (?, ?, ?)", (term, pack_ids(doc_ids, 0), pack_freqs(freqs))
+                )
+            self.connection.execute("DELETE FROM postings")
+            self.connection.execute("INSERT INTO postings SELECT term, 0, docs, freqs FROM merged")
+            self.connection.execute("DROP TABLE merged")
+            self.connection.execute("DELETE FROM doc_lengths")
+            self.connection.execute(
+                "INSERT INTO doc_lengths (chunk, lengths) VALUES (0, ?)", (pack_ints(self.doc_lengths[:self.flushed]),)
+            )
+            return True
+
+    # Function to record the file state and the covered bytes the index matches
+    def save_meta(self, key, prefix_length, data):
+        with self.lock:
+            self.key = tuple(key)
+            self.prefix_length = prefix_length
+            self.prefix_digest = prefix_digest(data[:prefix_length])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                [("version", INDEX_VERSION), ("key", json.dumps(list(key))),
+                 ("prefix_length", prefix_length), ("prefix_digest", self.prefix_digest)],
+            )
+
+    # Function to get a term's posting list and its parallel term frequencies.
+    # Only the records this index has read are taken from the file, in case
+    # another process extended it since.
+    def posting(self, term):
+        with self.lock:
+            cached = self.cache.get(term)
+            if cached is not None:
+                self.cache.move_to_end(term)
+                return cached
+            doc_ids = []
+            freqs = []
+            rows = self.connection.execute(
+                "SELECT chunk, docs, freqs FROM postings WHERE term = ? AND chunk < ? ORDER BY chunk", (term, self.flushed)
+            )
+            for chunk, docs, counts in rows:
+                chunk_ids = unpack_ids(docs, chunk)
+                doc_ids.extend(chunk_ids)
+                freqs.extend(unpack_freqs(counts, len(chunk_ids)))
+            end = bisect.bisect_left(doc_ids, self.flushed)
+            del doc_ids[end:], freqs[end:]
+            pending_ids, pending_freqs = self.pending.get(term, ((), ()))
+            doc_ids.extend(pending_ids)
+            freqs.extend(pending_freqs)
+            self.cache[term] = doc_ids, freqs
+            while len(self.cache) > CACHE_TERMS:
+                self.cache.popitem(last=False)
+            return doc_ids, freqs
+
+    # Function to get the candidate record ids for a single keyword
+    def candidates(self, keyword):
+        keyword = normalize_text(keyword)
+        if " " in keyword:
+            return intersect_postings([self.candidates(part) for part in keyword.split(" ")])
+        if len(keyword) <= MAX_GRAM:
+            return self.posting(keyword)[0]
+        grams = {keyword[i:i + MAX_GRAM] for i in range(len(keyword) - MAX_GRAM + 1)}
+        lists = []
+        for gram in grams:
+            posting = self.posting(gram)[0]
+            if not posting:
+                return []
+            lists.append(posting)
+        return intersect_postings(lists)
+
+    # Function to find the record ids containing all keywords.
+    # get_text(doc_id) is only called for keywords longer than a trigram or with spaces.
+    def lookup(self, keywords, get_text):
+        keywords = [normalize_text(kw) for kw in keywords]
+        keywords = [kw for kw in keywords if kw]
+        if not keywords:
+            return []
+        doc_ids = intersect_postings([self.candidates(kw) for kw in keywords])
+        checked = [kw for kw in keywords if needs_check(kw)]
+        if checked:
+            doc_ids = [doc_id for doc_id in doc_ids if contains_all(get_text(doc_id), checked)]
+        return doc_ids
+
+    # Function to get how often a term of up to MAX_GRAM characters occurs in a record
+    def term_frequency(self, term, doc_id):
+        posting, freqs = self.posting(term)
+        position = bisect.bisect_left(posting, doc_id)
+        if position < len(posting) and posting[position] == doc_id:
+            return freqs[position]
+        return 0
+
+    # Function to rank the records containing all keywords with BM25 and
+    # return the top k as (score, doc_id), best first. Short keywords take
+    # their frequencies from the index; longer ones and ones with spaces are
+    # counted in the candidate records that lookup already had to read.
+    def rank(self, keywords, get_text, k=50):
+        keywords = [normalize_text(kw) for kw in keywords]
+        keywords = [kw for kw in keywords if kw]
+        doc_ids = self.lookup(keywords, get_text)
+        if not doc_ids:
+            return []
+        doc_count = max(self.doc_count, 1)
+        average_length = self.total_length / doc_count or 1
+        weights = {}
+        for kw in set(keywords):
+            df = len(self.candidates(kw)) or 1
+            weights[kw] = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+
+        def score(doc_id):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / average_length)
+            total = 0.0
+            for kw, weight in weights.items():
+                if needs_check(kw):
+                    tf = normalize_text(get_text(doc_id)).count(kw)
+                else:
+                    tf = self.term_frequency(kw, doc_id)
+                total += weight * tf * (BM25_K1 + 1) / (tf + norm)
+            return total
+
+        return heapq.nlargest(k, ((score(doc_id), doc_id) for doc_id in doc_ids))
+
+
+# Function to open the index file, replacing one written in an older format
+def open_index(path):
+    try:
+        return SearchIndex(path)
+    except sqlite3.OperationalError:
+        raise
+    except sqlite3.DatabaseError:
+        os.remove(path)  # e.g. the JSON index of earlier versions
+        return SearchIndex(path)
+
+
+# Function to load the on-disk index or build it from the records; ends[i]
+# is the byte offset in data where record i ends. Records appended since the
+# index was saved are added to it as a new chunk, but only when the bytes it
+# covers are unchanged (same length and digest); any other rewrite of the
+# file rebuilds it. Building writes a chunk every FLUSH_DOCS records, so
+# memory stays flat as the file grows.
+def load_or_build(path, key, texts, data=b"", ends=()):
+    try:
+        return update_index(open_index(path), key, texts, data, ends)
+    except (OSError, sqlite3.Error):
+        # read-only disk or an index being rewritten elsewhere: keep one in memory only
+        return update_index(SearchIndex(), key, texts, data, ends)
+
+
+def update_index(index, key, texts, data, ends):
+    if index.key == tuple(key) and index.doc_count == len(texts):
+        return index
+    with index.lock, index.connection:
+        count = index.doc_count
+        covered = ends[count - 1] if 0 < count <= len(ends) else 0
+        if (count > len(texts) or index.prefix_length != covered
+                or prefix_digest(data[:covered]) != index.prefix_digest):
+            index.clear()
+        for doc_id in range(index.doc_count, len(texts)):
+            index.add(doc_id, texts[doc_id])
+            if index.doc_count - index.flushed >= FLUSH_DOCS:
+                index.flush()
+        index.flush()
+        merged = index.merge_chunks()
+        index.save_meta(key, ends[-1] if ends else 0, data)
+    if merged:
+        try:
+            index.connection.execute("VACUUM")  # give the space of the old chunks back
+        except sqlite3.Error:
+            pass  # another reader is busy; the space is reused by later chunks
+    return index
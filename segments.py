@@ -0,0 +1,555 @@
+import argparse
+import base64
+import hashlib
+import json
+import lzma
+import os
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+
+from record_store import date_stamp, parse_records, split_gaps, tail_text
+from search_index import MAX_GRAM, contains_all, normalize_text, rank_records, text_length, tokenize_terms
+
+# Monthly segmented storage. Records live in one file per month
+# (records/2025-04.txt, same "{...}[YYYY:MM:DD]" format as aiRecord.txt) and a
+# small manifest.json keeps each segment's date range, size and a bloom filter
+# of its index terms (the same 1-3 character grams search_index uses).
+# Date queries only open the segments whose range overlaps, keyword search
+# skips segments whose bloom filter rules a term out and scans the rest in
+# parallel on a process pool. Only the current month is ever appended to, so
+# older segments are immutable and their parsed records are cached.
+#
+# Past months can be compressed: their text moves into independently
+# compressed blocks (records/2025-04.blk, zlib or lzma) and the manifest keeps
+# each block's byte offset, length and date range, so a date query only
+# decompresses the blocks it overlaps. Records added to a compressed month
+# later (e.g. by an upload merge) go to its plain .txt file as usual.
+#
+#   python segments.py split aiRecord.txt records/
+#   python segments.py compress records/ --codec lzma
+
+MANIFEST_NAME = "manifest.json"
+BLOOM_BITS_PER_TERM = 10
+BLOOM_HASHES = 4
+MIN_BLOOM_BITS = 8 * 1024
+POOL_WORKERS = min(4, os.cpu_count() or 1)
+BLOCK_SIZE = 64 * 1024  # uncompressed bytes per block
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 9), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+class BloomFilter:
+    def __init__(self, size_bits, hashes=BLOOM_HASHES, bits=None, items=0):
+        self.size_bits = size_bits
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((size_bits + 7) // 8)
+        self.items = items
+
+    def positions(self, term):
+        digest = hashlib.blake2b(term.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * step) % self.size_bits for i in range(self.hashes)]
+
+    def add(self, term):
+        new = False
+        for position in self.positions(term):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                new = True
+        if new:
+            self.items += 1
+
+    def __contains__(self, term):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(term))
+
+    # Function to tell if the filter holds more terms than it was sized for
+    def is_full(self):
+        return self.items * BLOOM_BITS_PER_TERM > self.size_bits
+
+    def to_json(self):
+        return {
+            "bits": base64.b64encode(bytes(self.bits)).decode("ascii"),
+            "size_bits": self.size_bits,
+            "hashes": self.hashes,
+            "items": self.items,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["size_bits"], data["hashes"], bytearray(base64.b64decode(data["bits"])), data["items"])
+
+    # Function to build a filter sized for a set of terms
+    @classmethod
+    def for_terms(cls, terms):
+        bloom = cls(max(MIN_BLOOM_BITS, len(terms) * BLOOM_BITS_PER_TERM * 2))
+        for term in terms:
+            bloom.add(term)
+        return bloom
+
+
+# Function to list the terms a record must contain to match a keyword
+def required_terms(keyword):
+    keyword = normalize_text(keyword)
+    if " " in keyword:
+        return set().union(*(required_terms(part) for part in keyword.split(" ")))
+    if len(keyword) <= MAX_GRAM:
+        return {keyword}
+    return {keyword[i:i + MAX_GRAM] for i in range(len(keyword) - MAX_GRAM + 1)}
+
+
+# Function to get the month segment name of a "YYYY:MM:DD" stamp
+def segment_name(stamp):
+    return stamp[:4] + "-" + stamp[5:7]
+
+
+# Function to read and parse one segment; cached by path and mtime since old segments never change
+@lru_cache(maxsize=64)
+def load_segment(path, mtime_ns):
+    try:
+        with open(path, "rb") as file:
+            return tuple(parse_records(file.read()))
+    except FileNotFoundError:
+        return ()
+
+
+# Function to decompress one block of a .blk file
+def read_block(path, block, codec):
+    with open(path, "rb") as file:
+        file.seek(block["offset"])
+        data = file.read(block["length"])
+    return CODECS[codec][1](data)
+
+
+# Function to decompress and parse one block of a .blk file; cached by file, mtime and position
+@lru_cache(maxsize=32)
+def load_block(path, mtime_ns, offset, length, codec):
+    return tuple(parse_records(read_block(path, {"offset": offset, "length": length}, codec)))
+
+
+# Function to get the records of a segment's compressed blocks, optionally
+# only the blocks whose date range overlaps start..end
+def block_records(path, blocks, codec, start=None, end=None):
+    if not blocks:
+        return []
+    mtime_ns = os.stat(path).st_mtime_ns
+    records = []
+    for block in blocks:
+        if start is not None and (block["last"] < start or block["first"] > end):
+            continue
+        records.extend(load_block(path, mtime_ns, block["offset"], block["length"], codec))
+    return records
+
+
+# Function to write segment text as independently compressed blocks, cut
+# after a record once a block holds block_size bytes; the text between
+# records is kept as it is. Returns the block index.
+def write_blocks(data, path, codec="zlib", block_size=BLOCK_SIZE):
+    compress = CODECS[codec][0]
+    records = parse_records(data)
+    blocks = []
+    group = []
+    start = 0
+    with open(path, "wb") as file:
+        for position, record in enumerate(records):
+            group.append(record)
+            end = record.offset + record.length
+            last = position + 1 == len(records)
+            if end - start < block_size and not last:
+                continue
+            if last:
+                end = len(data)  # the text after the last record goes with it
+            compressed = compress(data[start:end])
+            blocks.append({
+                "offset": file.tell(),
+                "length": len(compressed),
+                "first": min(record.date for record in group),
+                "last": max(record.date for record in group),
+                "records": len(group),
+            })
+            file.write(compressed)
+            group = []
+            start = end
+    return blocks
+
+
+# Function to scan one segment for records containing all keywords (runs in a pool worker)
+def scan_segment(path, keywords, blocks=(), codec=None):
+    keywords = [normalize_text(kw) for kw in keywords]
+    records = block_records(path[:-len(".txt")] + ".blk", blocks, codec) + list(scan_all(path))
+    return [record for record in records if contains_all(record.body, keywords)]
+
+
+# Function to scan one segment for ranking (runs in a pool worker): returns
+# the records containing all keywords, how many records contain each keyword,
+# and the segment's record count and total text length
+def count_segment(path, keywords, blocks=(), codec=None):
+    keywords = [normalize_text(kw) for kw in keywords]
+    records = block_records(path[:-len(".txt")] + ".blk", blocks, codec) + list(scan_all(path))
+    matches = []
+    doc_freqs = [0] * len(keywords)
+    for record in records:
+        text = normalize_text(record.body)
+        found = [kw in text for kw in keywords]
+        for i, hit in enumerate(found):
+            doc_freqs[i] += hit
+        if all(found):
+            matches.append(record)
+    return matches, doc_freqs, len(records), sum(text_length(record.body) for record in records)
+
+
+class SegmentStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.pool = None
+        self.manifest = {}
+        self.blooms = {}
+        self.manifest_mtime = None
+        self.generation = 0  # bumped when records land anywhere but the end of iter_records
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def segment_path(self, name):
+        return os.path.join(self.directory, name + ".txt")
+
+    def block_path(self, name):
+        return os.path.join(self.directory, name + ".blk")
+
+    # Function to get a segment's records: its compressed blocks (those
+    # overlapping start..end when given), then its plain text file
+    def segment_records(self, name, start=None, end=None):
+        entry = self.manifest.get(name, {})
+        records = block_records(self.block_path(name), entry.get("blocks"), entry.get("codec"), start, end)
+        return records + list(scan_all(self.segment_path(name)))
+
+    # Function to get a segment's whole text as bytes: its blocks, then its plain file
+    def segment_data(self, name):
+        entry = self.manifest.get(name, {})
+        parts = [read_block(self.block_path(name), block, entry["codec"]) for block in entry.get("blocks", ())]
+        if os.path.exists(self.segment_path(name)):
+            with open(self.segment_path(name), "rb") as file:
+                parts.append(file.read())
+        return b"".join(parts)
+
+    # Function to get the bytes a segment takes on disk
+    def segment_bytes(self, name):
+        return sum(os.path.getsize(path) for path in (self.segment_path(name), self.block_path(name)) if os.path.exists(path))
+
+    # Function to reload the manifest if another process changed it
+    def refresh(self):
+        with self.lock:
+            try:
+                mtime = os.stat(self.manifest_path()).st_mtime_ns
+            except FileNotFoundError:
+                return
+            if mtime == self.manifest_mtime:
+                return
+            with open(self.manifest_path(), "r", encoding="utf-8") as file:
+                self.manifest = json.load(file)
+            self.blooms = {name: BloomFilter.from_json(entry["bloom"]) for name, entry in self.manifest.items()}
+            self.manifest_mtime = mtime
+            self.generation += 1
+
+    def save_manifest(self):
+        for name, bloom in self.blooms.items():
+            self.manifest[name]["bloom"] = bloom.to_json()
+        tmp_path = self.manifest_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path())
+        self.manifest_mtime = os.stat(self.manifest_path()).st_mtime_ns
+
+    # Function to rebuild one segment's manifest entry from its file
+    def rebuild_segment(self, name):
+        records = self.segment_records(name)
+        terms = set()
+        for record in records:
+            terms.update(tokenize_terms(record.body))
+        self.blooms[name] = BloomFilter.for_terms(terms)
+        entry = self.manifest.setdefault(name, {})
+        entry.update({
+            "first": min(record.date for record in records),
+            "last": max(record.date for record in records),
+            "records": len(records),
+            "bytes": self.segment_bytes(name),
+            "length": sum(text_length(record.body) for record in records),  # for the BM25 average
+        })
+
+    def segment_names(self):
+        return sorted(self.manifest)
+
+    def count(self):
+        return sum(entry["records"] for entry in self.manifest.values())
+
+    def iter_records(self):
+        for name in self.segment_names():
+            yield from self.segment_records(name)
+
+    # Function to get the records from position start on, in iter_records
+    # order, reading only the newest segments that hold them
+    def records_from(self, start):
+        with self.lock:
+            names = self.segment_names()
+            first = len(names)
+            position = self.count()
+            while first and position > start:
+                first -= 1
+                position -= self.manifest[names[first]]["records"]
+            records = []
+            for name in names[first:]:
+                records.extend(self.segment_records(name))
+            return records[start - position:]
+
+    # Function to append formatted records, each to its month's segment;
+    # returns the byte offset of the first one there
+    def append(self, record_text):
+        data = record_text.encode("utf-8")
+        records = parse_records(data)
+        if not records:
+            return None
+        months = {}
+        for record in records:
+            months.setdefault(segment_name(record.date), []).append(record)
+        with self.lock:
+            offsets = [self.append_month(name, month_records, data) for name, month_records in months.items()]
+        return offsets[0]
+
+    # Function to append one month's records, cut exactly from data, to its
+    # segment; returns the byte offset of the first; call with the lock held
+    def append_month(self, name, records, source):
+        data = b"".join(b"\n\n" + source[record.offset:record.offset + record.length] for record in records)
+        self.refresh()
+        if self.manifest and name < max(self.manifest):
+            self.generation += 1  # an older month: records after it move down
+        with open(self.segment_path(name), "ab") as file:
+            offset = file.seek(0, os.SEEK_END)
+            file.write(data)
+        entry = self.manifest.get(name)
+        bloom = self.blooms.get(name)
+        if entry is None or bloom is None or bloom.is_full():
+            self.rebuild_segment(name)
+        else:
+            for record in records:
+                for term in tokenize_terms(record.body):
+                    bloom.add(term)
+                entry["first"] = min(entry["first"], record.date)
+                entry["last"] = max(entry["last"], record.date)
+            entry["records"] += len(records)
+            entry["bytes"] += len(data)
+            if "length" in entry:
+                entry["length"] += sum(text_length(record.body) for record in records)
+        self.save_manifest()
+        return offset + 2
+
+    # Function to list the segments whose bloom filters allow all keywords
+    def candidate_segments(self, keywords):
+        terms = set()
+        for kw in keywords:
+            terms.update(required_terms(kw))
+        return [
+            name for name in self.segment_names()
+            if all(term in self.blooms[name] for term in terms)
+        ]
+
+    def search(self, keywords):
+        keywords = [kw for kw in keywords if kw.strip()]
+        if not keywords:
+            return []
+        results = self.scan(scan_segment, self.candidate_segments(keywords), keywords)
+        return [record for records in results for record in records]
+
+    # Function to run a segment scan function over the named segments, in
+    # parallel on the process pool when there is more than one
+    def scan(self, function, names, keywords):
+        paths = [self.segment_path(name) for name in names]
+        blocks = [self.manifest[name].get("blocks", ()) for name in names]
+        codecs = [self.manifest[name].get("codec") for name in names]
+        if len(paths) <= 1:
+            return [function(path, keywords, block_list, codec) for path, block_list, codec in zip(paths, blocks, codecs)]
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+        return list(self.pool.map(function, paths, [keywords] * len(paths), blocks, codecs))
+
+    # Function to get the k best matches with BM25. Every segment whose bloom
+    # filter allows any keyword is scanned once, for the matches and for each
+    # keyword's record count. The average length comes from the manifest, or
+    # from the scanned segments for manifests written before it kept lengths.
+    def search_ranked(self, keywords, k=50):
+        keywords = list(dict.fromkeys(normalize_text(kw) for kw in keywords if kw.strip()))
+        if not keywords:
+            return []
+        names = [
+            name for name in self.segment_names()
+            if any(all(term in self.blooms[name] for term in required_terms(kw)) for kw in keywords)
+        ]
+        records = []
+        doc_freqs = dict.fromkeys(keywords, 0)
+        scanned = total_length = 0
+        for matches, counts, record_count, length in self.scan(count_segment, names, keywords):
+            records.extend(matches)
+            for kw, count in zip(keywords, counts):
+                doc_freqs[kw] += count
+            scanned += record_count
+            total_length += length
+        if not records:
+            return []
+        lengths = [entry.get("length") for entry in self.manifest.values()]
+        if None not in lengths:
+            total_length, scanned = sum(lengths), self.count()
+        return rank_records(records, keywords, doc_freqs, self.count(), total_length / scanned, k)
+
+    def by_date(self, day):
+        return self.by_date_range(day, day)
+
+    def by_date_range(self, start, end):
+        start, end = date_stamp(start), date_stamp(end)
+        records = []
+        for name in self.segment_names():
+            entry = self.manifest[name]
+            if entry["last"] < start or entry["first"] > end:
+                continue
+            records.extend(record for record in self.segment_records(name, start, end) if start <= record.date <= end)
+        records.sort(key=lambda record: record.date)
+        return records
+
+    # Function to yield the archive as text, one block or segment file at a time
+    def iter_text(self):
+        for name in self.segment_names():
+            entry = self.manifest[name]
+            for block in entry.get("blocks", ()):
+                yield read_block(self.block_path(name), block, entry["codec"]).decode("utf-8", errors="replace")
+            if os.path.exists(self.segment_path(name)):
+                with open(self.segment_path(name), "r", encoding="utf-8") as file:
+                    yield file.read()
+
+    def head(self):
+        names = self.segment_names()
+        records = self.segment_records(names[0]) if names else ()
+        return records[0].text().split("\n\n")[0] if records else ""
+
+    # Function to get the last n characters, reading only the ends of the newest
+    # segments (and only the last blocks of compressed ones)
+    def tail(self, n):
+        parts = []
+        size = 0
+        for name in reversed(self.segment_names()):
+            entry = self.manifest[name]
+            pieces = [tail_text(self.segment_path(name), n - size)]
+            for block in reversed(entry.get("blocks", ())):
+                if size + sum(len(piece) for piece in pieces) >= n:
+                    break
+                pieces.append(read_block(self.block_path(name), block, entry["codec"]).decode("utf-8", errors="replace"))
+            part = "".join(reversed(pieces))[-(n - size):]
+            parts.append(part)
+            size += len(part)
+            if size >= n:
+                break
+        return "".join(reversed(parts))
+
+    # Function to get the last n records, reading only the newest segments
+    def tail_records(self, n):
+        records = []
+        for name in reversed(self.segment_names()):
+            if len(records) >= n:
+                break
+            records = self.segment_records(name) + records
+        return records[-n:] if n > 0 else []
+
+    # Function to move a segment's records into compressed blocks; returns (plain bytes, compressed bytes)
+    def compress_segment(self, name, codec="zlib", block_size=BLOCK_SIZE):
+        with self.lock:
+            self.refresh()
+            data = self.segment_data(name)
+            if not parse_records(data):
+                return None
+            before = self.segment_bytes(name)
+            tmp_path = self.block_path(name) + ".tmp"
+            blocks = write_blocks(data, tmp_path, codec, block_size)
+            os.replace(tmp_path, self.block_path(name))
+            if os.path.exists(self.segment_path(name)):
+                os.remove(self.segment_path(name))
+            self.manifest[name].update({"blocks": blocks, "codec": codec, "bytes": self.segment_bytes(name)})
+            self.save_manifest()
+        return before, self.manifest[name]["bytes"]
+
+    # Function to compress every segment older than the current month, plus
+    # the plain records later added to already compressed ones
+    def compress_cold(self, codec="zlib", block_size=BLOCK_SIZE):
+        current = segment_name(date_stamp(datetime.now()))
+        results = {}
+        for name in self.segment_names():
+            if name < current and (os.path.exists(self.segment_path(name)) or self.manifest[name].get("codec") != codec):
+                result = self.compress_segment(name, codec, block_size)
+                if result:
+                    results[name] = result
+        return results
+
+
+# Function to get all records of a segment file through the immutable-segment cache
+def scan_all(path):
+    try:
+        return load_segment(path, os.stat(path).st_mtime_ns)
+    except FileNotFoundError:
+        return ()
+
+
+# Function to split aiRecord.txt into monthly segments; returns the segment
+# names and the characters of text outside records. Records are copied
+# byte for byte, each with the text before it (the blank line, or a note
+# without braces); text after the last record goes to that record's month.
+def split_archive(text_path, directory):
+    with open(text_path, "rb") as file:
+        data = file.read()
+    records, gaps = split_gaps(data)
+    store = SegmentStore(directory)
+    if store.manifest:
+        raise ValueError(f"{directory} already holds segments")
+    by_month = {}
+    for record, gap in zip(records, gaps):
+        raw = data[record.offset:record.offset + record.length]
+        by_month.setdefault(segment_name(record.date), []).append(gap + raw)
+    if records:
+        by_month[segment_name(records[-1].date)].append(gaps[-1])
+    outside = sum(len(gap.decode("utf-8", errors="replace").strip()) for gap in gaps)
+    with store.lock:
+        for name, parts in by_month.items():
+            with open(store.segment_path(name), "wb") as file:
+                file.writelines(parts)
+            store.rebuild_segment(name)
+        store.save_manifest()
+    return sorted(by_month), outside
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split aiRecord.txt into monthly segments.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    split_parser = commands.add_parser("split", help="write monthly segments and their manifest")
+    split_parser.add_argument("text_path")
+    split_parser.add_argument("directory")
+    compress_parser = commands.add_parser("compress", help="compress the segments of past months into blocks")
+    compress_parser.add_argument("directory")
+    compress_parser.add_argument("--codec", choices=sorted(CODECS), default="zlib")
+    compress_parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="uncompressed bytes per block")
+    args = parser.parse_args(argv)
+    if args.command == "split":
+        names, outside = split_archive(args.text_path, args.directory)
+        print(f"wrote {len(names)} segments: {', '.join(names)}; kept {outside} characters of text outside records")
+        return
+    results = SegmentStore(args.directory).compress_cold(args.codec, args.block_size)
+    for name, (before, after) in sorted(results.items()):
+        print(f"{name}: {before} -> {after} bytes")
+    print(f"compressed {len(results)} segments")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import argparse
+import os
+import threading
+
+from record_store import Record, RecordStore, date_stamp, parse_records, split_gaps
+from search_index import normalize_text, rank_records
+
+# Storage backends for the records. "text" is the plain aiRecord.txt file
+# behind RecordStore; "sqlite" keeps the records in an SQLite database with
+# an indexed date column and an FTS5 table (trigram tokenizer, so Chinese
+# substrings match) for keyword search; "segments" is one text file per month
+# (see segments.py). All expose the same methods, so the app runs against
+# whichever one AIRECORD_BACKEND names. Text outside records (notes without
+# braces, stray fragments) is kept in the gaps table, and records not written
+# in the canonical "{...}[date]" form keep their exact text in raw_records, so
+# importing and exporting gives back the exact file.
+#
+#   python storage.py import aiRecord.txt aiRecord.db
+#   python storage.py export aiRecord.db aiRecord.txt
+
+BACKENDS = ("text", "sqlite", "segments")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_date ON records (date);
+CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(
+    body, content='records', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS records_ai AFTER INSERT ON records BEGIN
+    INSERT INTO records_fts (rowid, body) VALUES (new.id, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS records_ad AFTER DELETE ON records BEGIN
+    INSERT INTO records_fts (records_fts, rowid, body) VALUES ('delete', old.id, old.body);
+END;
+CREATE TABLE IF NOT EXISTS gaps (
+    id INTEGER PRIMARY KEY,
+    before_id INTEGER UNIQUE,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS raw_records (
+    record_id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL
+);
+"""
+SEPARATOR = "\n\n"  # the text between records when there is no gaps row
+TEXT_BATCH = 256  # records read per query when streaming the archive text
+# A record's length without whitespace, as search_index.text_length counts it
+TEXT_LENGTH_SQL = (
+    "length(replace(replace(replace(replace(replace(body, ' ', ''), char(9), ''), char(10), ''), char(13), ''), char(12288), ''))"
+)
+RECORD_COLUMNS = "records.date, records.id, length(CAST(records.body AS BLOB)), records.body"
+
+
+# Function to quote a keyword as an FTS5 phrase
+def fts_phrase(keyword):
+    return '"' + keyword.replace('"', '""') + '"'
+
+
+# Function to escape a keyword for a LIKE pattern
+def like_pattern(keyword):
+    return "%" + keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+class SQLiteStore:
+    def __init__(self, path):
+        self.path = path
+        self.generation = 0  # records are only ever appended
+        self.lock = threading.RLock()
+        import sqlite3  # only loaded when the sqlite backend is used
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return [Record(*row) for row in self.connection.execute(sql, params)]
+
+    def refresh(self):
+        pass  # every query reads the database directly
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute("SELECT count(*) FROM records").fetchone()[0]
+
+    def iter_records(self):
+        return iter(self.query(f"SELECT {RECORD_COLUMNS} FROM records ORDER BY id"))
+
+    # Function to get the records from position start on, in insertion order
+    def records_from(self, start):
+        return self.query(f"SELECT {RECORD_COLUMNS} FROM records ORDER BY id LIMIT -1 OFFSET ?", (start,))
+
+    # Function to get what the exported text needs besides the records: {record
+    # id: text before it}, the text after the last record and {record id: exact record text}
+    def text_layout(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT before_id, text FROM gaps").fetchall()
+            raws = dict(self.connection.execute("SELECT record_id, text FROM raw_records"))
+        gaps = {before_id: text for before_id, text in rows if before_id is not None}
+        trailing = "".join(text for before_id, text in rows if before_id is None)
+        return gaps, trailing, raws
+
+    # Function to insert the records found in one formatted record text; returns the first id
+    def append(self, record_text):
+        records = parse_records(record_text.encode("utf-8"))
+        with self.lock, self.connection:
+            ids = [
+                self.connection.execute(
+                    "INSERT INTO records (date, body) VALUES (?, ?)", (record.date, record.body)
+                ).lastrowid
+                for record in records
+            ]
+            if ids:
+                # Text after the last record now comes before the new one, as in the text file
+                self.connection.execute(
+                    "UPDATE gaps SET before_id = ?, text = text || ? WHERE before_id IS NULL", (ids[0], SEPARATOR)
+                )
+        return ids[0] if ids else None
+
+    # Function to build the WHERE clause for "all keywords". FTS5 trigrams need
+    # at least 3 characters, so shorter keywords fall back to LIKE.
+    def keyword_filter(self, keywords):
+        keywords = [kw for kw in keywords if kw]
+        long_keywords = [kw for kw in keywords if len(kw) >= 3]
+        clauses = []
+        params = []
+        if long_keywords:
+            clauses.append("records_fts MATCH ?")
+            params.append(" AND ".join(fts_phrase(kw) for kw in long_keywords))
+        for kw in keywords:
+            if len(kw) < 3:
+                clauses.append("records.body LIKE ? ESCAPE '\\'")
+                params.append(like_pattern(kw))
+        return long_keywords, " AND ".join(clauses), params
+
+    def search(self, keywords):
+        long_keywords, where, params = self.keyword_filter(keywords)
+        if not where:
+            return []
+        if long_keywords:
+            sql = (f"SELECT {RECORD_COLUMNS} FROM records JOIN records_fts ON records_fts.rowid = records.id "
+                   f"WHERE {where} ORDER BY records.id")
+        else:
+            sql = f"SELECT {RECORD_COLUMNS} FROM records WHERE {where} ORDER BY records.id"
+        return self.query(sql, params)
+
+    # Function to get the k best matches by BM25. FTS5 ranks when every keyword
+    # is long enough for its trigrams; otherwise the matches are scored here,
+    # with each keyword's record count taken from FTS5 or LIKE.
+    def search_ranked(self, keywords, k=50):
+        long_keywords, where, params = self.keyword_filter(keywords)
+        if not where:
+            return []
+        if len(long_keywords) == len([kw for kw in keywords if kw]):
+            sql = (f"SELECT {RECORD_COLUMNS} FROM records JOIN records_fts ON records_fts.rowid = records.id "
+                   f"WHERE {where} ORDER BY bm25(records_fts) LIMIT ?")
+            return self.query(sql, params + [k])
+        records = self.search(keywords)
+        if not records:
+            return []
+        doc_freqs = {}
+        with self.lock:
+            for kw in keywords:
+                if not kw:
+                    continue
+                _, kw_where, kw_params = self.keyword_filter([kw])
+                from_sql = "records JOIN records_fts ON records_fts.rowid = records.id" if len(kw) >= 3 else "records"
+                doc_freqs[normalize_text(kw)] = self.connection.execute(
+                    f"SELECT count(*) FROM {from_sql} WHERE {kw_where}", kw_params
+                ).fetchone()[0]
+            doc_count, average_length = self.connection.execute(
+                f"SELECT count(*), avg({TEXT_LENGTH_SQL}) FROM records"
+            ).fetchone()
+        return rank_records(records, keywords, doc_freqs, doc_count, average_length, k)
+
+    def by_date(self, day):
+        return self.by_date_range(day, day)
+
+    def by_date_range(self, start, end):
+        return self.query(
+            f"SELECT {RECORD_COLUMNS} FROM records WHERE date BETWEEN ? AND ? ORDER BY date, id",
+            (date_stamp(start), date_stamp(end)),
+        )
+
+    # Function to yield the archive in the exact text format, one record at a
+    # time. Rows are read TEXT_BATCH at a time by id, holding the lock only
+    # per batch, so memory stays flat and saves are not blocked meanwhile.
+    def iter_text(self):
+        gaps, trailing, raws = self.text_layout()
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    "SELECT id, date, body FROM records WHERE id > ? ORDER BY id LIMIT ?", (last_id, TEXT_BATCH)
+                ).fetchall()
+            for record_id, date, body in rows:
+                yield gaps.get(record_id, SEPARATOR) + raws.get(record_id, "{" + body + "}[" + date + "]")
+            if len(rows) < TEXT_BATCH:
+                break
+            last_id = rows[-1][0]
+        if trailing:
+            yield trailing
+
+    # Function to get the exported text before its first blank line, like the text file's head
+    def head(self):
+        text = ""
+        for part in self.iter_text():
+            text += part
+            if "\n\n" in text:
+                break
+        return text.split("\n\n")[0]
+
+    # Function to get the last n characters of the exported text, reading only the newest records
+    def tail(self, n):
+        gaps, trailing, raws = self.text_layout()
+        parts = [trailing]
+        size = len(trailing)
+        with self.lock:
+            cursor = self.connection.execute("SELECT id, date, body FROM records ORDER BY id DESC")
+            for record_id, date, body in cursor:
+                if size >= n:
+                    break
+                part = gaps.get(record_id, SEPARATOR) + raws.get(record_id, "{" + body + "}[" + date + "]")
+                parts.append(part)
+                size += len(part)
+        return "".join(reversed(parts))[-n:]
+
+    # Function to get the last n records in archive order
+    def tail_records(self, n):
+        records = self.query(f"SELECT {RECORD_COLUMNS} FROM records ORDER BY id DESC LIMIT ?", (n,))
+        return records[::-1]
+
+
+# Function to open the store for a backend name
+def open_store(backend, text_path, db_path=None, segments_dir=None):
+    if backend == "sqlite":
+        return SQLiteStore(db_path or os.path.splitext(text_path)[0] + ".db")
+    if backend == "segments":
+        from segments import SegmentStore
+
+        return SegmentStore(segments_dir or os.path.join(os.path.dirname(text_path), "records"))
+    if backend == "text":
+        return RecordStore(text_path)
+    raise ValueError(f"unknown storage backend {backend!r}, expected one of {BACKENDS}")
+
+
+# Function to migrate aiRecord.txt into a new SQLite database, keeping the text
+# outside records; returns (record count, characters kept outside records)
+def import_text(text_path, db_path):
+    with open(text_path, "rb") as file:
+        data = file.read()
+    records, gaps = split_gaps(data)
+    gaps = [gap.decode("utf-8", errors="replace") for gap in gaps]
+    store = SQLiteStore(db_path)
+    with store.lock, store.connection:
+        if store.connection.execute("SELECT count(*) FROM records").fetchone()[0]:
+            raise ValueError(f"{db_path} already holds records")
+        outside = 0
+        for record, gap in zip(records, gaps):
+            record_id = store.connection.execute(
+                "INSERT INTO records (date, body) VALUES (?, ?)", (record.date, record.body)
+            ).lastrowid
+            if gap != SEPARATOR:
+                store.connection.execute("INSERT INTO gaps (before_id, text) VALUES (?, ?)", (record_id, gap))
+                outside += len(gap.strip())
+            raw = data[record.offset:record.offset + record.length].decode("utf-8", errors="replace")
+            if raw != record.text():
+                store.connection.execute("INSERT INTO raw_records (record_id, text) VALUES (?, ?)", (record_id, raw))
+        if gaps[-1]:
+            store.connection.execute("INSERT INTO gaps (before_id, text) VALUES (NULL, ?)", (gaps[-1],))
+            outside += len(gaps[-1].strip())
+    return len(records), outside
+
+
+# Function to write a SQLite store back out as aiRecord.txt; returns the record count
+def export_text(db_path, text_path):
+    store = SQLiteStore(db_path)
+    with open(text_path, "w", encoding="utf-8") as file:
+        for part in store.iter_text():
+            file.write(part)
+    return store.count()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move aiRecord records between the text file and SQLite.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="migrate aiRecord.txt into SQLite")
+    import_parser.add_argument("text_path")
+    import_parser.add_argument("db_path")
+    export_parser = commands.add_parser("export", help="write SQLite records back to the text format")
+    export_parser.add_argument("db_path")
+    export_parser.add_argument("text_path")
+    args = parser.parse_args(argv)
+    if args.command == "import":
+        count, outside = import_text(args.text_path, args.db_path)
+        print(f"imported {count} records and {outside} characters of text outside records")
+    else:
+        print(f"exported {export_text(args.db_path, args.text_path)} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,266 @@
+import time
+SCRIPT_STARTED = time.perf_counter()  # For the import-time / first-render measurement
 import streamlit as st
-from gtts import gTTS
 from datetime import datetime, timedelta
-import pytz
 import re  # Import regex
 import os
-import tempfile
-
-midwest = pytz.timezone("America/Chicago")
+from concurrent.futures import ThreadPoolExecutor
+from record_store import content_fingerprint, date_stamp, file_state, sort_paragraphs
+import fingerprints
+from storage import open_store
+from append_log import atomic_write
+from highlight import make_hit
+from assets import AssetCache
+from export import FORMATS, export_bytes, iter_export_text
+from keyword_counts import KeywordCounter
+from result_cache import ResultCache, normalize_query
+import timing
+from timing import NO_STAGE, StageTimer, timing_enabled_by_env
+import uuid
+IMPORTS_DONE = time.perf_counter()
+
+# Function to get the current Midwest time. The stdlib zoneinfo is cheap to
+# load on every first render; pytz is only imported where the system has no
+# time zone data (e.g. Windows without tzdata).
+def now_midwest():
+    try:
+        from zoneinfo import ZoneInfo
+        midwest = ZoneInfo("America/Chicago")
+    except Exception:
+        import pytz
+        midwest = pytz.timezone("America/Chicago")
+    return datetime.now(midwest)
 # Define the filename in the same directory as the script
 FILE_NAME = "aiRecord.txt"
 FILE_PATH = os.path.join(os.path.dirname(__file__), FILE_NAME)
-
-# Function to save text to a file
-def save_text_to_file(text, filename="aiRecord.txt"):
+STORAGE_BACKEND = os.environ.get("AIRECORD_BACKEND", "text")  # "text", "sqlite" or "segments"
+DB_PATH = os.environ.get("AIRECORD_DB", os.path.join(os.path.dirname(__file__), "aiRecord.db"))
+SEGMENTS_DIR = os.environ.get("AIRECORD_SEGMENTS", os.path.join(os.path.dirname(__file__), "records"))
+TTS_CACHE_DIR = os.path.join(os.path.dirname(__file__), "tts_cache")
+SEARCH_TOP_K = 50  # Number of hits kept when ordering by relevance
+PAGE_SIZES = [10, 20, 50, 100]  # Choices for results per page
+TIMING_LOG_PATH = os.path.join(os.path.dirname(__file__), "timing.jsonl")
+TTS_OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "tts_jobs")
+TTS_CACHE_MB = int(os.environ.get("AIRECORD_TTS_CACHE_MB", "200"))
+TTS_ENGINE = os.environ.get("AIRECORD_TTS_ENGINE", "gtts")  # "gtts", or "stub" to work offline
+RESULT_CACHE_SIZE = int(os.environ.get("AIRECORD_RESULT_CACHE", "128"))  # Search/date results kept across sessions
+
+# Function to save text to a file; returns False if the same record is already saved
+def save_text_to_file(text, filename=FILE_PATH):
     if text.strip():  # Check if the text is not empty
-        timestamp = datetime.now(midwest).strftime("%Y:%m:%d")
-        timestp = datetime.now(midwest).strftime("%Y-%m-%d: ")
+        timestamp = now_midwest().strftime("%Y:%m:%d")
+        timestp = now_midwest().strftime("%Y-%m-%d: ")
         text_with_timestamp = "{" + timestp + f" {text}" + "}" +  f"[{timestamp}]"
-        with open(filename, "a") as file:
-            file.write("\n\n" + text_with_timestamp)
-
-    # Update session state with new content
-    with open(filename, "r") as file:
-        st.session_state.file_content = file.read()
+        seen = get_fingerprints()
+        fingerprint = content_fingerprint(timestp + f" {text}")
+        if not seen.begin_write(fingerprint):  # checks and claims the fingerprint in one step
+            return False
+        try:
+            get_record_store(filename).append(text_with_timestamp)
+        except Exception:
+            seen.discard(fingerprint)
+            raise
+        seen.finish_write(fingerprint_state())
         st.session_state.todayLast = text_with_timestamp
+    return True
+
+# Function to get the archive state the fingerprint set is checked against
+def fingerprint_state():
+    if STORAGE_BACKEND == "text":
+        return file_state(FILE_PATH)
+    return (get_record_store().count(), 0)
+
+# Function to load the content fingerprints of all saved records, from
+# aiRecord.txt.fp when it is current, otherwise in one pass over the archive
+@st.cache_resource
+def load_fingerprints(path):
+    if STORAGE_BACKEND == "text":
+        return fingerprints.load_or_build(path)
+    records = get_record_store().iter_records()
+    return fingerprints.FingerprintSet((content_fingerprint(record.body) for record in records), key=fingerprint_state())
+
+# Function to get the fingerprint set, rebuilt if the archive changed outside this app
+def get_fingerprints():
+    seen = load_fingerprints(FILE_PATH)
+    if not seen.is_current(fingerprint_state()):
+        load_fingerprints.clear()
+        seen = load_fingerprints(FILE_PATH)
+    return seen
+
+# Function to start loading the shared record store of the configured backend in
+# the background, so the page can paint before the archive is parsed and indexed
+@st.cache_resource
+def start_record_store(path):
+    return ThreadPoolExecutor(max_workers=1).submit(open_store, STORAGE_BACKEND, path, DB_PATH, SEGMENTS_DIR)
+
+# Function to get the shared record store, waiting for the background load if needed;
+# the text backend reparses only when the file size or mtime changes
+def get_record_store(path=FILE_PATH):
+    loading = start_record_store(path)
+    if loading.exception() is not None:
+        start_record_store.clear()  # retry the load on the next rerun instead of caching the failure
+    store = loading.result()
+    store.refresh()
+    return store
+
+# Function to get the keyword counters of all sessions, by keyword list; a
+# counter is only built when a sidebar first needs it
+@st.cache_resource
+def get_keyword_counters():
+    return {}
+
+# Function to get the keyword counts. Records appended since the counter was
+# last used are counted from the store; it is rebuilt in one pass over the
+# archive only if the store was reloaded (upload replace, outside edits)
+def get_keyword_counter():
+    counters = get_keyword_counters()
+    keywords = tuple(get_keyword_list())
+    store = get_record_store()
+    version = (store, store.generation)
+    counter = counters.get(keywords)
+    if counter is None or counter.version != version or counter.record_count > store.count():
+        counter = KeywordCounter(keywords, store.iter_records())
+        counter.version = version
+        counters.pop(keywords, None)
+        while len(counters) >= 4:
+            counters.pop(next(iter(counters)))
+        counters[keywords] = counter
+    counter.catch_up(store)
+    return counter
+
+# Function to get the display-sized image variants; each is built the first time it is shown
+@st.cache_resource
+def get_asset_cache():
+    return AssetCache()
+
+# Function to show an image through its cached display-sized variant
+def show_image(name, width=None):
+    st.image(get_asset_cache().get(os.path.join(os.path.dirname(__file__), name)), width=width)
+
+# Function to load the shared speech cache
+@st.cache_resource
+def get_audio_cache():
+    from tts_cache import AudioCache, make_synthesizer
+    return AudioCache(TTS_CACHE_DIR, make_synthesizer(TTS_ENGINE), max_bytes=TTS_CACHE_MB * 1024 * 1024)
+
+# Function to load the shared background speech queue
+@st.cache_resource
+def get_tts_queue():
+    from tts_jobs import TTSJobQueue
+    return TTSJobQueue(get_audio_cache(), TTS_OUTPUT_DIR)
+
+# Function to queue speech for this session and remember the job under job_key
+def start_tts_job(job_key, text, lang, label, file_name):
+    with stage("tts"):
+        job_id = get_tts_queue().submit(st.session_state.session_id, text, lang)
+    st.session_state[job_key] = {"id": job_id, "label": label, "file_name": file_name}
+
+# Function to show the status or the audio of the job remembered under job_key
+def show_tts_job(job_key):
+    from tts_jobs import DONE, ERROR
+    info = st.session_state.get(job_key)
+    with stage("tts"):
+        job = get_tts_queue().status(info["id"]) if info else None
+    if job is None:
+        return
+    if job.status == DONE:
+        # Play the generated audio
+        st.audio(job.path)
+        with open(job.path, "rb") as file:
+            st.download_button(
+                label=info["label"],
+                data=file,
+                file_name=info["file_name"],
+                mime="audio/mp3",
+                key=f"download_{job_key}"
+            )
+    elif job.status == ERROR:
+        st.error(f"Speech failed: {job.error}")
+    else:
+        if job.first_audio:
+            st.audio(job.first_audio, format="audio/mp3")
+        st.info(f"Speech {job.status}...")
+        if st.button("refresh", key=f"refresh_{job_key}"):
+            st.rerun()
 
-# Function to search for keywords in the file content
-def search_keywords_in_file(keywords, file_content):
-    matching_paragraphs = []
-    matches = re.findall(r'(\{.*?\})\s*(\[\d{4}:\d{2}:\d{2}\])', file_content, re.DOTALL)
-    
-    for content, timestamp in matches:
-        content_lower = " ".join(content.lower().split())
-        if all(kw.lower() in content_lower for kw in keywords):
-            highlighted_content = content  # Copy content for modification
-            
-            # Change highlight color
-            highlight_color = "#efd06c"  # Change this to match your theme
-
-            for kw in keywords:
-                highlighted_content = re.sub(
-                    rf"({re.escape(kw)})",
-                    rf'<span style="background-color: {highlight_color}; color: black; font-weight: bold; padding: 2px 4px; border-radius: 3px;">\1</span>',
-                    highlighted_content,
-                    flags=re.IGNORECASE
-                )
-
-            matching_paragraphs.append(f"{highlighted_content} {timestamp}")
-
-    return matching_paragraphs
+# Function to start timing this rerun; on with AIRECORD_TIMING=1 or ?debug=1 in the URL
+def start_stage_timer():
+    enabled = timing_enabled_by_env() or st.query_params.get("debug") == "1"
+    st.session_state.stage_timer = StageTimer(enabled, TIMING_LOG_PATH)
+
+# Function to time a named stage of this rerun
+def stage(name):
+    timer = st.session_state.get("stage_timer")
+    return timer.stage(name) if timer else NO_STAGE
+
+# Function to log this rerun's stage timings and keep them for the debug panel,
+# with the import time, the time to first render and whether it was a cold start
+def finish_stage_timer():
+    timer = st.session_state.get("stage_timer")
+    cold = timing.mark_run()
+    run = timer.finish(
+        session=st.session_state.get("session_id"),
+        cold=cold,
+        import_ms=round((IMPORTS_DONE - SCRIPT_STARTED) * 1000, 3),
+        first_render_ms=st.session_state.pop("first_render_ms", None),
+        result_cache=get_result_cache().stats(),
+    ) if timer else None
+    if run:
+        st.session_state.last_stage_run = run
+
+# Function to show the stage timings of the previous rerun
+def show_stage_timings():
+    timer = st.session_state.get("stage_timer")
+    if not (timer and timer.enabled):
+        return
+    with st.expander("Debug: rerun timings"):
+        run = st.session_state.get("last_stage_run")
+        if run:
+            st.write(f"Previous rerun: {run['total_ms']:.1f} ms (imports {run['import_ms']} ms, "
+                     f"first render {run['first_render_ms']} ms{', cold start' if run['cold'] else ''})")
+            st.table({"stage": [s["name"] for s in run["stages"]], "ms": [s["ms"] for s in run["stages"]]})
+        stats = get_result_cache().stats()
+        st.write(f"Result cache: {stats['hits']} hits, {stats['misses']} misses "
+                 f"(hit rate {stats['hit_rate']}), {stats['entries']}/{stats['max_entries']} entries")
+        st.write("This rerun so far:")
+        st.table({"stage": [name for name, _ in timer.stages], "ms": [round(ms, 3) for _, ms in timer.stages]})
+
+# Function to get the result cache shared by all sessions
+@st.cache_resource
+def get_result_cache():
+    return ResultCache(RESULT_CACHE_SIZE)
+
+# Function to get a query result from the shared cache; saves and uploads change
+# the archive version, which drops the cached results
+def cached_result(key, compute):
+    return get_result_cache().get(key, fingerprint_state(), compute)
 
-# Function to extract timestamp from a paragraph
-def extract_timestamp(paragraph):
-    if "[" in paragraph and "]" in paragraph:
-        timestamp_str = paragraph[paragraph.rfind("[") + 1 : paragraph.rfind("]")]
-        try:
-            return datetime.strptime(timestamp_str.strip(), "%Y:%m:%d")
-        except ValueError:
-            return None
-    return None
-
-# Function to sort paragraphs by timestamp and length
-def sort_paragraphs(paragraphs):
-    sorted_paragraphs = []
-    for paragraph in paragraphs:
-        timestamp = extract_timestamp(paragraph) or datetime.min
-        sorted_paragraphs.append((timestamp, paragraph))
-    sorted_paragraphs.sort(key=lambda x: (x[0], len(x[1])), reverse=True)
-    return [p for _, p in sorted_paragraphs]
+# Function to search for keywords in the file content
+def search_keywords_in_file(keywords):
+    return get_record_store().search(keywords)
+
+# Function to get the SEARCH_TOP_K most relevant records, ranked with BM25
+def search_keywords_ranked(keywords, k=SEARCH_TOP_K):
+    return get_record_store().search_ranked(keywords, k)
+
+# Function to search and order the records the way the "Order results by" choice asks
+def run_search(keywords):
+    query = normalize_query(keywords)
+    if st.session_state.get("search_order") == "relevance":
+        with stage("search"):
+            results = cached_result(("ranked", query), lambda: search_keywords_ranked(keywords))
+    else:
+        with stage("search"):
+            results = cached_result(("search", query), lambda: search_keywords_in_file(keywords))
+        with stage("sort"):
+            results = cached_result(("sorted", query), lambda: sort_paragraphs(results))
+    set_results(results, keywords)
+
+# Function to show new results from the first page; keywords are highlighted when a page is drawn
+def set_results(records, keywords=()):
+    st.session_state.matching_paragraphs = records
+    st.session_state.highlight_keywords = list(keywords)
+    st.session_state.result_page = 0
 
 # Function to clear text input
 
@@ -80,17 +273,23 @@ def load_keyword_list(filename="keywords.txt"):
         return []
 
 
-# Function to get paragraphs by date with trimmed content
-def get_paragraphs_by_date(file_content, target_date):
-    paragraphs = file_content.split("{")
-    matching_paragraphs = []
-    for paragraph in paragraphs:
-        timestamp = extract_timestamp(paragraph)
-        if timestamp and timestamp.date() == target_date.date():
-            #trimmed_text = paragraph[-30:]  # Get only the last 20 characters
-            #trimmed_text1 = paragraph[:20]  # Get only the first 20 characters
-            matching_paragraphs.append(paragraph)
-    return matching_paragraphs
+# Function to get the saved keywords, read from keywords.txt the first time they are needed
+def get_keyword_list():
+    if "keyword_list" not in st.session_state:
+        st.session_state.keyword_list = load_keyword_list()
+    return st.session_state.keyword_list
+
+# Function to get paragraphs by date
+def get_paragraphs_by_date(target_date):
+    with stage("date filter"):
+        day = date_stamp(target_date)
+        return cached_result(("dates", day, day), lambda: get_record_store().by_date(target_date))
+
+# Function to get paragraphs stamped from start_date to end_date, both inclusive
+def get_paragraphs_by_date_range(start_date, end_date):
+    with stage("date filter"):
+        key = ("dates", date_stamp(start_date), date_stamp(end_date))
+        return cached_result(key, lambda: get_record_store().by_date_range(start_date, end_date))
 
 def cleanSymbols(text=""):
     plain_text  = text.replace("#","").replace("*","")
@@ -99,20 +298,21 @@ def cleanSymbols(text=""):
         
 # Streamlit app
 def main():
+    start_stage_timer()
+    # Shared record store, parsed once per file change for all sessions; it loads
+    # in the background while the title and header image render
+    start_record_store(FILE_PATH)
     st.title("AI Record App")
     images=["lotus.jpg", "cherry.jpeg","fivek.jpg"]
     
     def getImage(num=0):
         return images[num]
     
-    st.image("lotus.jpg",width=705)
-    # Initialize session state for file content
-    if "file_content" not in st.session_state:
-        try:
-            with open("aiRecord.txt", "r") as file:
-                st.session_state.file_content = file.read()
-        except FileNotFoundError:
-            st.session_state.file_content = ""
+    with stage("images"):
+        show_image("lotus.jpg",width=705)
+    st.session_state.first_render_ms = round((time.perf_counter() - SCRIPT_STARTED) * 1000, 3)
+    with stage("file load"):  # the part of the load still running after the first paint
+        get_record_store()
 
     # Initialize other session states
     if "text_area_content" not in st.session_state:
@@ -121,8 +321,10 @@ def main():
         st.session_state.todayLast = ""
     if "matching_paragraphs" not in st.session_state:
         st.session_state.matching_paragraphs = []
-    if "keyword_list" not in st.session_state:
-        st.session_state.keyword_list = load_keyword_list()
+    if "highlight_keywords" not in st.session_state:
+        st.session_state.highlight_keywords = []
+    if "result_page" not in st.session_state:
+        st.session_state.result_page = 0
     if "search_phrase" not in st.session_state:
         st.session_state.search_phrase = ""
     if "text_area_contentR" not in st.session_state:
@@ -142,58 +344,79 @@ def main():
         st.session_state.new_text_saved = False  # Track if new text has been saved
     if "text_saved" not in st.session_state:
         st.session_state.text_saved = False  # Track if text has been saved
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex  # Names this session's speech files
 
     col1,col2 = st.columns(2)
     with col1:
     # Sidebar for keyword management
         showSideBar = st.checkbox("showSideBar")
-        if showSideBar:
-            with st.sidebar:
-                st.subheader("Keyword List")
-                keyword_input = st.text_area(
-                    "Enter keywords (one per line):",
-                    value="\n".join(st.session_state.keyword_list),
-                    height=150
-                )
+        with stage("sidebar"):
+            if showSideBar:
+                with st.sidebar:
+                    st.subheader("Keyword List")
+                    keyword_input = st.text_area(
+                        "Enter keywords (one per line):",
+                        value="\n".join(get_keyword_list()),
+                        height=150
+                    )
             
-                # Save Keywords button
-                if st.button("Save Keywords"):
-                    keywords = [k.strip() for k in keyword_input.splitlines() if k.strip()]
-                    with open("keywords.txt", "w") as file:
-                        file.write("\n".join(keywords))
-                    st.session_state.keyword_list = keywords
-                    st.success("Keywords saved successfully!")
+                    # Save Keywords button
+                    if st.button("Save Keywords"):
+                        keywords = [k.strip() for k in keyword_input.splitlines() if k.strip()]
+                        with open("keywords.txt", "w") as file:
+                            file.write("\n".join(keywords))
+                        st.session_state.keyword_list = keywords
+                        st.success("Keywords saved successfully!")
             
-                st.subheader("Saved Keywords")
+                    st.subheader("Saved Keywords")
         
-            with st.sidebar:
-            # Arrange saved keywords in columns
-                if st.session_state.keyword_list:
-                    num_columns = 3  # Number of columns to display buttons in
-                    keyword_chunks = [st.session_state.keyword_list[i:i + num_columns] for i in range(0, len(st.session_state.keyword_list), num_columns)]
+                with st.sidebar:
+                # Arrange saved keywords in columns
+                    if get_keyword_list():
+                        counter = get_keyword_counter()
+                        num_columns = 3  # Number of columns to display buttons in
+                        keyword_chunks = [st.session_state.keyword_list[i:i + num_columns] for i in range(0, len(st.session_state.keyword_list), num_columns)]
             
-                    for chunk in keyword_chunks:
-                        cols = st.columns(num_columns)
-                        for i, keyword in enumerate(chunk):
-                            with cols[i]:
-                                if st.button(keyword, key=f"keyword_{keyword}"):
-                                    st.session_state.search_phrase = keyword
-                                    if i<=len(images)-1:
-                                        st.session_state.image = getImage(i)
-                                    st.session_state.matching_paragraphs = search_keywords_in_file([keyword], st.session_state.file_content)
-                                    st.session_state.matching_paragraphs = sort_paragraphs(st.session_state.matching_paragraphs)
-                                    st.rerun()  # Use st.rerun() instead of st.experimental_rerun()
+                        for chunk in keyword_chunks:
+                            cols = st.columns(num_columns)
+                            for i, keyword in enumerate(chunk):
+                                with cols[i]:
+                                    if st.button(f"{keyword} ({counter.count(keyword)})", key=f"keyword_{keyword}"):
+                                        st.session_state.search_phrase = keyword
+                                        if i<=len(images)-1:
+                                            st.session_state.image = getImage(i)
+                                        # Served from the precomputed counts, no rescan
+                                        results = cached_result(("keyword", keyword), lambda: sort_paragraphs(counter.records_for(keyword)))
+                                        set_results(results, [keyword])
+                                        st.rerun()  # Use st.rerun() instead of st.experimental_rerun()
     with col2:
     ## upload
         show_upload = st.checkbox("Upload local records", value=False)
         
         if show_upload:
+            # Replacing rewrites aiRecord.txt, which only the text backend reads
+            upload_modes = ["merge", "replace"] if STORAGE_BACKEND == "text" else ["merge"]
+            upload_mode = st.radio("Upload mode", upload_modes, horizontal=True)
             uploaded_file = st.file_uploader("Choose txt file", type=["txt"])
-            if uploaded_file is not None:
-                st.session_state.file_content = uploaded_file.read().decode('utf-8')
-                # Save uploaded file as "aiRecord.txt" on server
-                with open("aiRecord.txt", "wb") as f:
-                    f.write(uploaded_file.getbuffer())
+            if uploaded_file is not None and upload_mode == "merge":
+                # Merge new records into the archive once per uploaded file, skipping duplicates
+                if st.session_state.get("merged_upload") != uploaded_file.file_id:
+                    seen = get_fingerprints()
+                    seen.begin_merge()  # keeps the set from being rebuilt under the merge
+                    try:
+                        added, skipped = fingerprints.merge_stream(get_record_store(), uploaded_file, seen)
+                    except Exception:
+                        seen.abort_write()
+                        raise
+                    seen.finish_write(fingerprint_state())
+                    st.session_state.merged_upload = uploaded_file.file_id
+                    st.success(f"Merged {added} new records, skipped {skipped} already saved.")
+            elif uploaded_file is not None:
+                # Save uploaded file as "aiRecord.txt" on server once per uploaded file, replaced atomically under the write lock
+                if st.session_state.get("replaced_upload") != uploaded_file.file_id:
+                    atomic_write(FILE_PATH, [uploaded_file.getbuffer()])
+                    st.session_state.replaced_upload = uploaded_file.file_id
                     st.success("aiRecord.txt saved successfully!")
             
     # Text input area
@@ -208,18 +431,21 @@ def main():
     col1, col2, col3, col4, col5=st.columns(5)
     with col1:
         if st.button("recentR 1000"):
-            st.session_state.text_area_content = f"Recent 1000: {st.session_state.file_content[-1000:][:50]}"
-            st.session_state.text_area_contentR = "Recent 1000: "+ cleanSymbols(st.session_state.file_content[-1000:])
+            recent = get_record_store().tail(1000)
+            st.session_state.text_area_content = f"Recent 1000: {recent[:50]}"
+            st.session_state.text_area_contentR = "Recent 1000: "+ cleanSymbols(recent)
             st.rerun()
     with col2:
         if st.button("recentR 2000"):
-            st.session_state.text_area_content = f"Recent 2000: {st.session_state.file_content[-2000:][:50]}"
-            st.session_state.text_area_contentR = "Recent 2000: "+ cleanSymbols(st.session_state.file_content[-2000:])
+            recent = get_record_store().tail(2000)
+            st.session_state.text_area_content = f"Recent 2000: {recent[:50]}"
+            st.session_state.text_area_contentR = "Recent 2000: "+ cleanSymbols(recent)
             st.rerun()
     with col3:
         if st.button("recentR 4000"):
-            st.session_state.text_area_content = f"Recent 4000: {st.session_state.file_content[-4000:][:50]}"
-            st.session_state.text_area_contentR = "Recent 4000: " + cleanSymbols(st.session_state.file_content[-4000:])
+            recent = get_record_store().tail(4000)
+            st.session_state.text_area_content = f"Recent 4000: {recent[:50]}"
+            st.session_state.text_area_contentR = "Recent 4000: " + cleanSymbols(recent)
             st.rerun()
     with col4:
         if st.button("useNow"):
@@ -245,33 +471,25 @@ def main():
                     #plain_text = plain_text.replace(char, "")
                 plain_text = cleanSymbols(plain_text)
 
-                tts = gTTS(text=plain_text, lang="zh")
-                tts.save("recent.mp3")
-                # Play the generated audio
-                st.audio("recent.mp3")
-                with open("recent.mp3", "rb") as file:
-                        st.download_button(
-                            label="Download Audio",
-                            data=file,
-                            file_name=f"{st.session_state.text_area_contentR[:12]}.mp3",
-                            mime="audio/mp3"            
-                        )
+                start_tts_job("talk_job", plain_text, "zh", "Download Audio", f"{st.session_state.text_area_contentR[:12]}.mp3")
             else: 
                 st.write("no text to talk")
+        show_tts_job("talk_job")
     with col2:
         if st.button("clear talk"):
-            if os.path.exists("recent.mp3"):
-                os.remove("recent.mp3")
+            for job_key in ("talk_job", "talk_en_job", "speak_job"):
+                st.session_state.pop(job_key, None)
+            if get_tts_queue().clear_session(st.session_state.session_id):
                 st.success("Speech file cleared!")
             else:
                 st.warning("No speech file to clear.")
         #st.code(f"Recent: {st.session_state.file_content[-4000:]}")
     with col3:
         if st.button("show today" if st.session_state.showing else "clear text"):
-            if st.session_state.showing and st.session_state.get("file_content"):
-                today = datetime.now(midwest)
-                st.session_state.matching_paragraphs = get_paragraphs_by_date(st.session_state.file_content, today)
-                full_text = "".join(st.session_state.matching_paragraphs)
+            if st.session_state.showing and get_record_store().count():
+                today = now_midwest()
+                set_results(get_paragraphs_by_date(today))
+                full_text = "\n\n".join(record.paragraph() for record in st.session_state.matching_paragraphs)
                 st.session_state.text_area_content=cleanSymbols(full_text)
                 st.session_state.showing = False
             else:
@@ -291,22 +509,13 @@ def main():
                     #plain_text = plain_text.replace(char, "")
                 plain_text = cleanSymbols(plain_text)
 
-                tts = gTTS(text=plain_text, lang="en")
-                tts.save("recent.mp3")
-                # Play the generated audio
-                st.audio("recent.mp3")
-                with open("recent.mp3", "rb") as file:
-                        st.download_button(
-                            label="Download Eng speak",
-                            data=file,
-                            file_name=f"{st.session_state.text_area_contentR[:12]}.mp3",
-                            mime="audio/mp3"            
-                        )
+                start_tts_job("talk_en_job", plain_text, "en", "Download Eng speak", f"{st.session_state.text_area_contentR[:12]}.mp3")
             else: 
                 st.write("no text to talk")
+        show_tts_job("talk_en_job")
     
-    content_without_whitespace = "".join(st.session_state.file_content[-20:-1].split())# space is cause line breaks in display
-    st.code(f"Last: {content_without_whitespace}...{st.session_state.file_content.split("\n\n")[0]}")
+    content_without_whitespace = "".join(get_record_store().tail(20)[:-1].split())# space is cause line breaks in display
+    st.code(f"Last: {content_without_whitespace}...{get_record_store().head()}")
 
     # Secret key input
     secret_key = st.text_input("Enter the secret key to enable saving:", type="password")
@@ -318,11 +527,13 @@ def main():
     with col1:
         if st.button("Save Text", disabled=save_button_disabled):
             if  user_text != "" and cleanSymbols(user_text.strip()):
-                save_text_to_file(cleanSymbols(user_text.strip()))
-                st.session_state.text_area_content = ""
-            #user_text =""
-                st.session_state.show_confirmation = True
-                st.rerun()  
+                if save_text_to_file(cleanSymbols(user_text.strip())):
+                    st.session_state.text_area_content = ""
+                #user_text =""
+                    st.session_state.show_confirmation = True
+                    st.rerun()  
+                else:
+                    st.warning("Already saved: the same text is in the record")
             else:
                 st.write("maybe saved already")
         # Show confirmation message and ClearInput button
@@ -330,12 +541,13 @@ def main():
             st.success("Text saved successfully!")
             st.session_state.show_confirmation = False
 
-            if st.session_state.file_content:
+            if get_record_store().count():
+                data, file_name, mime = export_bytes(iter_export_text(get_record_store()), "txt")
                 st.download_button(
                     label="Download aiRecord.txt",
-                    data=st.session_state.file_content,
-                    file_name="aiRecord.txt",
-                    mime="text/plain"
+                    data=data,
+                    file_name=file_name,
+                    mime=mime
                 )
             else:
                 st.error("No file found to download.")
@@ -348,18 +560,37 @@ def main():
                 st.session_state.text_area_content = ""
             st.rerun()
     
+    # Export: whole archive, a date range or the current results, optionally compressed
+    with st.expander("Export records"):
+        export_scope = st.radio("Export", ["all", "date range", "current results"], horizontal=True)
+        export_format = st.selectbox("Format", list(FORMATS), index=1)
+        today = now_midwest().date()
+        export_range = st.date_input("Export from / to", value=(today.replace(day=1), today), key="export_range")
+        if st.button("Prepare export"):
+            if export_scope == "date range" and len(export_range) != 2:
+                st.warning("Please pick both a start and an end date.")
+            else:
+                if export_scope == "date range":
+                    chunks = iter_export_text(get_record_store(), *export_range)
+                elif export_scope == "current results":
+                    chunks = iter_export_text(get_record_store(), records=st.session_state.matching_paragraphs)
+                else:
+                    chunks = iter_export_text(get_record_store())
+                data, file_name, mime = export_bytes(chunks, export_format)
+                st.download_button(label=f"Download {file_name}", data=data, file_name=file_name, mime=mime)
+
     # Search functionality
     st.subheader("Search for Information")
     search_phrase = st.text_input(
         "Enter keywords to search (separated by spaces):",
         value=st.session_state.search_phrase
     )
+    st.radio("Order results by", ["date", "relevance"], horizontal=True, key="search_order")
 
     if st.button("Search"):
         if search_phrase:
             keyword_list = search_phrase.strip().split()
-            st.session_state.matching_paragraphs = search_keywords_in_file(keyword_list, st.session_state.file_content)
-            st.session_state.matching_paragraphs = sort_paragraphs(st.session_state.matching_paragraphs)
+            run_search(keyword_list)
             st.rerun()  # Use st.rerun() instead of st.experimental_rerun()
         else:
             st.warning("Please enter keywords to search.")
@@ -372,22 +603,39 @@ def main():
     col1, col2, col3 = st.columns(3)
     with col1:
         if st.button("ytDay"):
-            if st.session_state.get("file_content"):
-                yesterday = datetime.now(midwest) - timedelta(days=1)
-                st.session_state.matching_paragraphs = get_paragraphs_by_date(st.session_state.file_content, yesterday)
+            if get_record_store().count():
+                yesterday = now_midwest() - timedelta(days=1)
+                set_results(get_paragraphs_by_date(yesterday))
                 st.rerun()
             else:
                 st.warning("No file content available.")
 
     with col2:
         if st.button("toDay"):
-            if st.session_state.get("file_content"):
-                today = datetime.now(midwest)
-                st.session_state.matching_paragraphs = get_paragraphs_by_date(st.session_state.file_content, today)
+            if get_record_store().count():
+                today = now_midwest()
+                set_results(get_paragraphs_by_date(today))
                 st.rerun()
             else:
                 st.warning("No file content available.")
 
+    # Date range queries
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("last 7 days"):
+            today = now_midwest()
+            set_results(get_paragraphs_by_date_range(today - timedelta(days=6), today))
+            st.rerun()
+    with col2:
+        today = now_midwest().date()
+        date_range = st.date_input("from / to", value=(today.replace(day=1), today))
+        if st.button("show range"):
+            if len(date_range) == 2:
+                set_results(get_paragraphs_by_date_range(*date_range))
+                st.rerun()
+            else:
+                st.warning("Please pick both a start and an end date.")
+
     # Button to toggle expand/collapse state
 
 
@@ -398,69 +646,83 @@ def main():
             st.rerun()
     
     # Display matching paragraphs
-    if st.session_state.get("matching_paragraphs"):
-        st.subheader("Matching Paragraphs:")
+    with stage("rendering"):
+        if st.session_state.get("matching_paragraphs"):
+            st.subheader("Matching Paragraphs:")
+
+            # Only the records on the current page are highlighted and rendered
+            results = st.session_state.matching_paragraphs
+            page_size = st.selectbox("Results per page", PAGE_SIZES, index=1, key="page_size")
+            page_count = (len(results) + page_size - 1) // page_size
+            page = min(st.session_state.result_page, page_count - 1)
+            start = page * page_size
+            page_hits = [make_hit(record.paragraph(), st.session_state.highlight_keywords) for record in results[start:start + page_size]]
+
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                if st.button("◀ Prev", disabled=page == 0):
+                    st.session_state.result_page = page - 1
+                    st.rerun()
+            with col2:
+                st.write(f"{start + 1}–{start + len(page_hits)} of {len(results)} matches (page {page + 1}/{page_count})")
+            with col3:
+                if st.button("Next ▶", disabled=page >= page_count - 1):
+                    st.session_state.result_page = page + 1
+                    st.rerun()
     
-        if st.session_state.expand_all:
-            full_text = "<br>".join(st.session_state.matching_paragraphs)
-            st.markdown(full_text, unsafe_allow_html=True)
-            plain_text = re.sub(r'<.*?>', '', full_text)
-            #st.session_state.fullText = plain_text
+            if st.session_state.expand_all:
+                full_text = "<br>".join(hit.html for hit in page_hits)
+                st.markdown(full_text, unsafe_allow_html=True)
+                plain_text = "\n".join(hit.plain for hit in page_hits)
+                #st.session_state.fullText = plain_text
             
-            # Copy button (removes HTML tags before copying)
-            if st.button("Copy"):
-                plain_text = re.sub(r'<.*?>', '', full_text)  # Remove HTML tags
-                # Remove non-text symbols but keep letters, numbers, spaces, and specific punctuation
-                # Remove non-text symbols but keep letters, numbers, and common punctuation
+                # Copy button (copies the plain text, no HTML tags)
+                if st.button("Copy"):
+                    # Remove non-text symbols but keep letters, numbers, spaces, and specific punctuation
+                    # Remove non-text symbols but keep letters, numbers, and common punctuation
                 
-                st.code(plain_text)
-                st.write("Copied to clipboard!")
+                    st.code(plain_text)
+                    st.write("Copied to clipboard!")
     
-            # Speak button
-            if st.button("🔊 Speak"):
-                # Convert the cleaned text to speech
-                #tts = gTTS(plain_text, lang="zh")
-                # Remove specific characters
-                characters_to_remove= "*#}"
-                for char in characters_to_remove:
-                    plain_text = plain_text.replace(char, "")
+                # Speak button
+                if st.button("🔊 Speak"):
+                    # Convert the cleaned text to speech
+                    #tts = gTTS(plain_text, lang="zh")
+                    # Remove specific characters
+                    characters_to_remove= "*#}"
+                    for char in characters_to_remove:
+                        plain_text = plain_text.replace(char, "")
     
-                if plain_text:
-                    tts = gTTS(text=plain_text, lang="zh")
-                    tts.save("output.mp3")
-        
-        # Play the generated audio
-                    st.audio("output.mp3")
-        
-        # Provide a download link for the audio file
-                    with open("output.mp3", "rb") as file:
-                        st.download_button(
-                            label="Download Audio",
-                            data=file,
-                            file_name="output.mp3",
-                            mime="audio/mp3"            
-                        )
-        else:
+                    if plain_text:
+                        # Long texts are synthesized in parallel chunks; the first one plays while the rest finish
+                        start_tts_job("speak_job", plain_text, "zh", "Download Audio", "output.mp3")
+                show_tts_job("speak_job")
+            else:
        
-            # Show each paragraph as an expandable block without highlights when collapsed
-            for idx, paragraph in enumerate(st.session_state.matching_paragraphs):
-                truncated_text = f"......{paragraph[:50]}"  # Show only the first 50 characters
+                # Show each paragraph as an expandable block without highlights when collapsed
+                for idx, paragraph in enumerate(page_hits):
+                    truncated_text = f"......{paragraph.plain[:50]}"  # Show only the first 50 characters
 
-                with st.expander(truncated_text):
-                    # Ensure highlights work when expanded
-                    cleaned_paragraph = f'<div style=" pre-wrap;">{paragraph}</div>'
-                    st.markdown(cleaned_paragraph, unsafe_allow_html=True)
+                    with st.expander(truncated_text):
+                        # Ensure highlights work when expanded
+                        cleaned_paragraph = f'<div style=" pre-wrap;">{paragraph.html}</div>'
+                        st.markdown(cleaned_paragraph, unsafe_allow_html=True)
 
-    else:
-        st.warning("No matching paragraphs found.")
+        else:
+            st.warning("No matching paragraphs found.")
+
+    show_stage_timings()
 
     
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        finish_stage_timer()
 
 #######
     
-st.image(st.session_state.image)
-st.image("note.jpg")
+show_image(st.session_state.image)
+show_image("note.jpg")
 #fig, axes = plt.subplots(nro
 #from textblob import TextBlob
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+BODIES = [
+    "今天按揉脾经，小腿发热",
+    "morning run, felt relaxed",
+    "经络\n按摩之后后背轻松",
+    "脾经 小腿 酸胀，胃也舒服",
+    "breathing and sleep better",
+    "胃 胃 胃 气血 通畅",
+]
+
+
+# Function to format a record exactly as the app saves it
+def make_record(day, body):
+    return "{" + day + ":  " + body + "}[" + day.replace("-", ":") + "]"
+
+
+# Function to get a small archive text with notes outside the records
+def make_archive(bodies=BODIES):
+    records = [make_record(f"2025-04-{day:02d}", body) for day, body in enumerate(bodies, 1)]
+    return "header note\n\n" + "\n\n".join(records) + "\n\nloose note\n"
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "aiRecord.txt"
+    path.write_text(make_archive(), encoding="utf-8")
+    return str(path)
@@ -0,0 +1,72 @@
+import io
+
+import fingerprints
+from conftest import make_archive, make_record
+from fingerprints import STALE_KEY, FingerprintSet
+from record_store import RecordStore, content_fingerprint, file_state, parse_records
+
+
+def test_a_fingerprint_is_claimed_once(tmp_path):
+    seen = FingerprintSet(path=None)
+    digest = content_fingerprint("2025-05-01:  保存")
+    assert seen.begin_write(digest)
+    assert not seen.begin_write(digest)
+    assert seen.is_current((1, 2))  # a save is in flight
+    seen.finish_write((1, 2))
+    assert seen.writing == 0
+    assert seen.is_current((1, 2))
+    assert not seen.is_current((3, 4))
+
+
+def test_a_discarded_claim_can_be_retried_and_marks_the_set_stale(tmp_path):
+    seen = FingerprintSet()
+    digest = content_fingerprint("2025-05-01:  写入失败")
+    assert seen.begin_write(digest)
+    seen.discard(digest)
+    assert digest not in seen
+    assert seen.key == STALE_KEY
+    assert seen.begin_write(digest)
+
+
+def test_add_many_writes_new_digests_once(tmp_path):
+    path = str(tmp_path / "aiRecord.txt.fp")
+    FingerprintSet().save(path, (0, 0))
+    seen, _ = FingerprintSet.load(path)
+    a, b = content_fingerprint("a"), content_fingerprint("b")
+    assert seen.add_many([a, b, a]) == [True, True, False]
+    assert seen.add_many([b]) == [False]
+    loaded, key = FingerprintSet.load(path)
+    assert key == (0, 0)
+    assert loaded.digests == {a, b}
+    assert len(open(path, "rb").read()) == fingerprints.HEADER.size + 2 * fingerprints.DIGEST_SIZE
+
+
+def test_compact_removes_duplicates_and_keeps_text_outside_records(tmp_path):
+    path = tmp_path / "aiRecord.txt"
+    text = make_archive() + "\n\nfree text\n\n" + make_record("2025-04-02", "morning  run, felt RELAXED")
+    path.write_text(text, encoding="utf-8")
+    kept, removed = fingerprints.compact(str(path))
+    assert (kept, removed) == (6, 1)
+    assert path.read_text(encoding="utf-8") == make_archive() + "\n\nfree text"
+    assert fingerprints.load_or_build(str(path)).key == file_state(str(path))
+
+
+def test_merge_stream_appends_new_records_in_one_commit(archive):
+    store = RecordStore(archive)
+    seen = fingerprints.load_or_build(archive)
+    upload = make_archive() + "\n\n" + "\n\n".join(make_record("2025-05-01", f"上传 {i}") for i in range(50))
+    seen.begin_merge()
+    added, skipped = fingerprints.merge_stream(store, io.BytesIO(upload.encode("utf-8")), seen)
+    seen.finish_write(file_state(archive))
+    assert (added, skipped) == (50, 6)
+    assert store.log.commits == 1
+    assert len(store.search(["上传"])) == 50
+    assert fingerprints.load_or_build(archive).digests == seen.digests
+    with open(archive, "rb") as file:
+        assert len(parse_records(file.read())) == 56
+
+
+def test_merge_stream_skips_repeats_within_the_upload(archive):
+    store = RecordStore(archive)
+    upload = "\n\n".join([make_record("2025-05-01", "重复")] * 3)
+    assert fingerprints.merge_stream(store, io.BytesIO(upload.encode("utf-8"))) == (1, 2)
@@ -0,0 +1,45 @@
+import threading
+
+from conftest import make_record
+from keyword_counts import KeywordCounter
+from record_store import RecordStore
+
+
+def test_keywords_match_like_search(archive):
+    store = RecordStore(archive)
+    keywords = ["经络 按摩", "脾经", "胃", "RELAXED", "脾经 小腿"]
+    counter = KeywordCounter(keywords, store.iter_records())
+    for keyword in keywords:
+        assert counter.count(keyword) == len(store.search([keyword])), keyword
+    assert counter.count("经络 按摩") == 1
+
+
+def test_catch_up_counts_records_saved_together(archive):
+    store = RecordStore(archive)
+    counter = KeywordCounter(["脾经"], store.iter_records())
+    barrier = threading.Barrier(2)
+
+    def save(i):
+        barrier.wait()
+        store.append(make_record("2025-05-01", f"脾经 {i}"))
+
+    threads = [threading.Thread(target=save, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.catch_up(store)
+    counter.catch_up(store)
+    assert counter.count("脾经") == 4
+    assert counter.record_count == store.count()
+
+
+def test_a_reload_bumps_the_store_generation(archive):
+    store = RecordStore(archive)
+    generation = store.generation
+    store.append(make_record("2025-05-01", "追加"))
+    assert store.generation == generation
+    with open(archive, "w", encoding="utf-8") as file:
+        file.write(make_record("2025-05-02", "替换"))
+    store.refresh()
+    assert store.generation == generation + 1
@@ -0,0 +1,19 @@
+import json
+
+import pytest
+
+import query
+
+
+def test_dates_prints_records_as_json_lines(archive, capsys):
+    query.main(["--file", archive, "dates", "2025-04-02", "2025-04-03"])
+    rows = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [row["date"] for row in rows] == ["2025:04:02", "2025:04:03"]
+
+
+@pytest.mark.parametrize("bad", ["2025-13-01", "2025-02-30", "yesterday"])
+def test_a_bad_date_is_a_usage_error(archive, capsys, bad):
+    with pytest.raises(SystemExit) as exit_info:
+        query.main(["--file", archive, "dates", bad])
+    assert exit_info.value.code == 2
+    assert "invalid date" in capsys.readouterr().err
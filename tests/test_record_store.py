@@ -0,0 +1,93 @@
+import sqlite3
+import threading
+
+import pytest
+
+import search_index
+from conftest import make_record
+from record_store import RecordStore, parse_records
+
+
+def test_concurrent_appends_are_group_committed(archive):
+    store = RecordStore(archive)
+    texts = [make_record("2025-05-01", f"并发保存 {i}") for i in range(40)]
+    barrier = threading.Barrier(8)
+
+    def save(part):
+        barrier.wait()
+        for text in part:
+            store.append(text)
+
+    threads = [threading.Thread(target=save, args=(texts[i::8],)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.log.commits <= len(texts)
+    with open(archive, "rb") as file:
+        saved = [record.body for record in parse_records(file.read())]
+    assert sorted(saved[-40:]) == sorted(record.body for record in parse_records("".join(texts).encode("utf-8")))
+    assert len(store.search(["并发保存"])) == 40
+    assert store.count() == len(saved)
+
+
+def test_append_returns_the_offset_of_the_record(archive):
+    store = RecordStore(archive)
+    text = make_record("2025-05-02", "偏移量")
+    offset = store.append(text)
+    with open(archive, "rb") as file:
+        data = file.read()
+    assert data[offset:offset + len(text.encode("utf-8"))] == text.encode("utf-8")
+
+
+def test_keywords_with_spaces_match_any_whitespace(archive):
+    store = RecordStore(archive)
+    assert [record.date for record in store.search(["经络 按摩"])] == ["2025:04:03"]
+    assert [record.date for record in store.search(["脾经  小腿"])] == ["2025:04:04"]
+    assert store.search(["经络按摩"]) == []
+
+
+def test_index_is_extended_after_an_append(archive):
+    RecordStore(archive)
+    store = RecordStore(archive)
+    store.append(make_record("2025-05-03", "新增 脾经"))
+    reopened = RecordStore(archive)
+    chunks = sqlite3.connect(archive + ".idx").execute("SELECT chunk FROM doc_lengths ORDER BY chunk").fetchall()
+    assert chunks == [(0,), (6,)]
+    assert [record.date for record in reopened.search(["脾经"])] == ["2025:04:01", "2025:04:04", "2025:05:03"]
+
+
+def test_index_is_rebuilt_after_a_middle_edit(archive):
+    RecordStore(archive)
+    with open(archive, "r", encoding="utf-8") as file:
+        text = file.read()
+    with open(archive, "w", encoding="utf-8") as file:
+        file.write(text.replace("今天按揉脾经", "今天按揉肝经") + "\n\n" + make_record("2025-05-04", "末尾"))
+    store = RecordStore(archive)
+    assert [record.date for record in store.search(["脾经"])] == ["2025:04:04"]
+    assert [record.date for record in store.search(["肝经"])] == ["2025:04:01"]
+
+
+def test_an_old_json_index_is_replaced(archive):
+    with open(archive + ".idx", "w", encoding="utf-8") as file:
+        file.write('{"version": 5, "postings": {}}')
+    store = RecordStore(archive)
+    assert len(store.search(["胃"])) == 2
+
+
+@pytest.mark.parametrize("keywords", [["脾经"], ["胃"], ["小腿", "脾经"], ["relaxed"]])
+def test_merged_chunks_give_the_same_results(archive, monkeypatch, keywords):
+    monkeypatch.setattr(search_index, "FLUSH_DOCS", 1)
+    monkeypatch.setattr(search_index, "MAX_CHUNKS", 2)
+    for day in range(5, 9):
+        RecordStore(archive).append(make_record(f"2025-05-{day:02d}", "追加 脾经"))
+    store = RecordStore(archive)
+    assert sqlite3.connect(archive + ".idx").execute("SELECT count(*) FROM doc_lengths").fetchone()[0] <= 2
+    monkeypatch.undo()
+    fresh = RecordStore(archive, archive + ".fresh.idx")
+    assert [record.offset for record in store.search_ranked(keywords)] == [
+        record.offset for record in fresh.search_ranked(keywords)
+    ]
+    assert store.search(keywords) and [record.offset for record in store.search(keywords)] == [
+        record.offset for record in fresh.search(keywords)
+    ]
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from conftest import make_record
+from record_store import RecordStore
+from segments import SegmentStore, split_archive
+from storage import SQLiteStore, export_text, import_text
+
+QUERIES = [["脾经"], ["胃"], ["脾经", "小腿"], ["relaxed"], ["胃", "气血"], ["经络 按摩"]]
+
+
+@pytest.fixture
+def stores(archive, tmp_path):
+    db_path = str(tmp_path / "aiRecord.db")
+    import_text(archive, db_path)
+    split_archive(archive, str(tmp_path / "records"))
+    return RecordStore(archive), SQLiteStore(db_path), SegmentStore(str(tmp_path / "records"))
+
+
+def test_sqlite_round_trip_is_exact(archive, tmp_path):
+    db_path = str(tmp_path / "aiRecord.db")
+    assert import_text(archive, db_path) == (6, len("header note") + len("loose note"))  # non-blank text outside records
+    out = str(tmp_path / "out.txt")
+    export_text(db_path, out)
+    with open(archive, "rb") as original, open(out, "rb") as exported:
+        assert exported.read() == original.read()
+
+
+def test_segments_keep_the_exact_text(archive, stores):
+    _, _, segments = stores
+    with open(archive, "r", encoding="utf-8") as file:
+        assert "".join(segments.iter_text()) == file.read()
+
+
+@pytest.mark.parametrize("keywords", QUERIES)
+def test_ranking_matches_the_text_backend(stores, keywords):
+    text, sqlite, segments = stores
+    expected = [record.body for record in text.search_ranked(keywords)]
+    assert expected
+    assert [record.body for record in segments.search_ranked(keywords)] == expected
+    if all(len(kw) < 3 for kw in keywords):  # scored like the text index; FTS5 bm25 ranks the rest
+        assert [record.body for record in sqlite.search_ranked(keywords)] == expected
+
+
+def test_records_from_follows_appends(stores):
+    for store in stores:
+        count = store.count()
+        store.append(make_record("2025-04-30", "补记"))
+        assert [record.body for record in store.records_from(count)] == ["2025-04-30:  补记"]
+        assert store.records_from(count + 1) == []
+
+
+def test_segment_append_splits_records_by_month(stores):
+    _, _, segments = stores
+    generation = segments.generation
+    segments.append(make_record("2025-03-01", "三月") + "\n\n" + make_record("2025-04-28", "四月"))
+    assert sorted(segments.manifest) == ["2025-03", "2025-04"]
+    assert segments.generation > generation
+    assert len(segments.search(["三月"])) == len(segments.search(["四月"])) == 1
+    assert os.path.exists(segments.segment_path("2025-03"))
@@ -0,0 +1,56 @@
+import os
+import time
+
+from tts_cache import AudioCache, StubSynthesizer, split_sentences
+from tts_jobs import DONE, TTSJobQueue
+
+TEXT = "第一句话说完了。" * 40 + "And an English sentence. " * 20
+
+
+def stub_audio(chunk, lang="zh"):
+    return f"[{lang}] {chunk}\n".encode("utf-8")
+
+
+def test_stitched_audio_is_the_chunks_in_order_even_when_evicted(tmp_path):
+    cache = AudioCache(str(tmp_path), StubSynthesizer(), max_bytes=10)
+    firsts = []
+    audio = cache.get_stitched(TEXT, "zh", on_first_chunk=firsts.append)
+    chunks = split_sentences(TEXT)
+    assert len(chunks) > 2
+    assert audio == b"".join(stub_audio(chunk) for chunk in chunks)
+    assert firsts == [stub_audio(chunks[0])]
+
+
+def test_stitched_audio_is_served_from_the_cache(tmp_path):
+    synthesizer = StubSynthesizer()
+    cache = AudioCache(str(tmp_path), synthesizer)
+    first = cache.get_stitched(TEXT)
+    calls = synthesizer.calls
+    assert cache.get_stitched(TEXT) == first
+    assert synthesizer.calls == calls
+    assert cache.hits == 1
+
+
+def test_jobs_finish_with_a_tiny_cache(tmp_path):
+    cache = AudioCache(str(tmp_path / "cache"), StubSynthesizer(), max_bytes=200)
+    queue = TTSJobQueue(cache, str(tmp_path / "jobs"))
+    texts = [f"第{i}段。" * 60 for i in range(6)]
+    job_ids = [queue.submit("session", text) for text in texts]
+    queue.executor.shutdown(wait=True)
+    for job_id, text in zip(job_ids, texts):
+        job = queue.status(job_id)
+        assert job.status == DONE, job.error
+        with open(job.path, "rb") as file:
+            assert file.read() == b"".join(stub_audio(chunk) for chunk in split_sentences(text))
+
+
+def test_finished_jobs_are_forgotten_after_max_age(tmp_path):
+    cache = AudioCache(str(tmp_path / "cache"), StubSynthesizer())
+    queue = TTSJobQueue(cache, str(tmp_path / "jobs"), max_age=0.05)
+    job_id = queue.submit("session", "hello.")
+    queue.executor.shutdown(wait=True)
+    path = queue.jobs[job_id].path
+    time.sleep(0.1)
+    assert queue.status(job_id) is None
+    assert not queue.jobs
+    assert not os.path.exists(path)
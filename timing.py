@@ -0,0 +1,66 @@
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+# Per-rerun stage timing. Each named stage of a script run (file load,
+# search, sort, date filter, TTS, rendering...) is timed with
+# `with timer.stage("search"):`, and finish() appends the whole run as one
+# JSON line to a log file. A disabled timer hands out a shared no-op context,
+# so leaving the calls in place costs next to nothing. The app adds its import
+# time, time to first render and a cold-start flag to each run.
+
+NO_STAGE = nullcontext()
+first_run_done = False  # module state lives as long as the server process
+
+
+# Function to tell if this is the first script run of the process (a cold start)
+def mark_run():
+    global first_run_done
+    cold = not first_run_done
+    first_run_done = True
+    return cold
+
+
+class StageTimer:
+    def __init__(self, enabled=False, log_path=None):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.started = time.perf_counter()
+        self.stages = []  # (name, milliseconds) in the order they finished
+
+    def stage(self, name):
+        if not self.enabled:
+            return NO_STAGE
+        return self.timed(name)
+
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, (time.perf_counter() - start) * 1000))
+
+    # Function to close the run and log it; returns the run record, None when disabled
+    def finish(self, **fields):
+        if not self.enabled:
+            return None
+        run = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "stages": [{"name": name, "ms": round(ms, 3)} for name, ms in self.stages],
+        }
+        run.update(fields)
+        if self.log_path:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as file:
+                    file.write(json.dumps(run, ensure_ascii=False) + "\n")
+            except OSError:
+                pass
+        return run
+
+
+# Function to tell if timing was switched on through the environment
+def timing_enabled_by_env():
+    return os.environ.get("AIRECORD_TIMING", "") not in ("", "0", "false")
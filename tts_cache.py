@@ -0,0 +1,186 @@
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# On-disk cache of synthesized speech, keyed by a hash of (text, lang).
+# The least recently used clips are evicted once the cache grows past
+# max_bytes. Synthesis goes through a small Synthesizer interface so the
+# local StubSynthesizer can stand in for gTTS (which needs the network).
+# Chunks of a long text are passed around as bytes, not cache paths, since a
+# small cache may evict a chunk's file before it is stitched.
+# Long texts are split at sentence ends and the pieces synthesized in
+# parallel, then stitched in order; MP3 frames can simply be concatenated.
+
+SENTENCE_END = re.compile(r"(?<=[。！？.!?])")
+
+
+class Synthesizer:
+    # Function to turn text into MP3 bytes
+    def synthesize(self, text, lang):
+        raise NotImplementedError
+
+
+class GTTSSynthesizer(Synthesizer):
+    def synthesize(self, text, lang):
+        from gtts import gTTS
+
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+# Offline stand-in for gTTS, for trying the cache without the network.
+# Every clip is a few fake bytes derived from the text; calls are counted.
+class StubSynthesizer(Synthesizer):
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def synthesize(self, text, lang):
+        with self.lock:
+            self.calls += 1
+        return f"[{lang}] {text}\n".encode("utf-8")
+
+
+# Function to get the synthesizer for an engine name: "gtts" or "stub"
+def make_synthesizer(engine="gtts"):
+    if engine == "stub":
+        return StubSynthesizer()
+    return GTTSSynthesizer()
+
+
+# Function to get the cache key of a text in a language
+def audio_key(text, lang):
+    return hashlib.sha1(f"{lang}\0{text}".encode("utf-8")).hexdigest()
+
+
+# Function to split text at sentence ends into chunks of at most max_chars
+def split_sentences(text, max_chars=300):
+    chunks = []
+    current = ""
+    for sentence in SENTENCE_END.split(text):
+        while len(sentence) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if len(current) + len(sentence) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += sentence
+    if current:
+        chunks.append(current)
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+class AudioCache:
+    def __init__(self, directory, synthesizer=None, max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.synthesizer = synthesizer or GTTSSynthesizer()
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> size, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.scan()
+
+    # Function to pick up clips left on disk by an earlier run, oldest first
+    def scan(self):
+        clips = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".mp3"):
+                stat = os.stat(os.path.join(self.directory, name))
+                clips.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(clips):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + ".mp3")
+
+    # Function to get the path of a cached clip and mark it recently used,
+    # or None on a miss; call with the lock held
+    def lookup(self, key):
+        path = self.path_for(key)
+        if key in self.entries and os.path.exists(path):
+            self.entries.move_to_end(key)
+            self.hits += 1
+            os.utime(path)
+            return path
+        return None
+
+    # Function to get the bytes of a cached clip, or None on a miss. They are
+    # read under the lock, so eviction cannot remove the file in between.
+    def read_cached(self, key):
+        with self.lock:
+            path = self.lookup(key)
+            if path:
+                with open(path, "rb") as file:
+                    return file.read()
+        return None
+
+    # Function to get the MP3 bytes for a text, synthesizing them on a miss
+    def read(self, text, lang="zh"):
+        key = audio_key(text, lang)
+        audio = self.read_cached(key)
+        if audio is not None:
+            return audio
+        audio = self.synthesizer.synthesize(text, lang)
+        with self.lock:
+            self.misses += 1
+            self.store(key, audio)
+        return audio
+
+    # Function to write a clip into the cache; call with the lock held
+    def store(self, key, audio):
+        path = self.path_for(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(audio)
+        os.replace(tmp_path, path)
+        self.total_bytes += len(audio) - self.entries.pop(key, 0)
+        self.entries[key] = len(audio)
+        self.evict()
+
+    # Function to synthesize the chunks of a long text on a bounded thread
+    # pool, yielding the chunk bytes in text order as soon as each is ready
+    def iter_chunks(self, text, lang="zh", max_workers=4):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.read, chunk, lang) for chunk in split_sentences(text)]
+            for future in futures:
+                yield future.result()
+
+    # Function to get the MP3 bytes of one stitched clip for a long text.
+    # on_first_chunk(audio) is called with the first chunk's bytes as soon as
+    # it can be played.
+    def get_stitched(self, text, lang="zh", on_first_chunk=None, max_workers=4):
+        key = audio_key(text, lang)
+        audio = self.read_cached(key)
+        if audio is not None:
+            return audio
+        parts = []
+        for audio in self.iter_chunks(text, lang, max_workers):
+            if not parts and on_first_chunk:
+                on_first_chunk(audio)
+            parts.append(audio)
+        audio = b"".join(parts)
+        with self.lock:
+            self.store(key, audio)
+        return audio
+
+    # Function to drop least recently used clips until the cache fits max_bytes
+    def evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
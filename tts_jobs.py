@@ -0,0 +1,109 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Background speech synthesis. Jobs run on a small worker pool so a long
+# Talk/Speak does not block the Streamlit script run, and every job writes its
+# own file under output_dir/<session id>/ so sessions never clobber each
+# other's audio. The UI reads the job status (queued/running/done/error) on
+# each rerun. Finished jobs are forgotten, and their audio files deleted,
+# max_age after they end.
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+
+
+class TTSJob:
+    __slots__ = ("id", "session_id", "text", "lang", "status", "path", "first_audio", "error", "finished")
+
+    def __init__(self, session_id, text, lang):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.text = text
+        self.lang = lang
+        self.status = QUEUED
+        self.path = None
+        self.first_audio = None  # MP3 bytes of the first chunk, playable while the rest is synthesized
+        self.error = None
+        self.finished = None  # time.time() when the job ended
+
+
+class TTSJobQueue:
+    def __init__(self, cache, output_dir, workers=2, max_age=24 * 3600):
+        self.cache = cache
+        self.output_dir = output_dir
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        self.jobs = {}
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+        self.purge(max_age)
+
+    # Function to queue a text for synthesis and return the job id
+    def submit(self, session_id, text, lang="zh"):
+        job = TTSJob(session_id, text, lang)
+        with self.lock:
+            self.forget_finished()
+            self.jobs[job.id] = job
+        self.executor.submit(self.run, job)
+        return job.id
+
+    def run(self, job):
+        job.status = RUNNING
+        try:
+            def set_first(audio):
+                job.first_audio = audio
+
+            audio = self.cache.get_stitched(job.text, job.lang, on_first_chunk=set_first)
+            session_dir = os.path.join(self.output_dir, job.session_id)
+            os.makedirs(session_dir, exist_ok=True)
+            path = os.path.join(session_dir, job.id + ".mp3")
+            with open(path, "wb") as file:
+                file.write(audio)
+            job.path = path
+            job.first_audio = None  # the whole clip is on disk now
+            job.status = DONE
+        except Exception as error:
+            job.error = str(error)
+            job.status = ERROR
+        job.finished = time.time()
+
+    def status(self, job_id):
+        with self.lock:
+            self.forget_finished()
+            return self.jobs.get(job_id)
+
+    # Function to drop jobs that ended more than max_age ago, with their audio; call with the lock held
+    def forget_finished(self):
+        cutoff = time.time() - self.max_age
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished and job.finished < cutoff]:
+            job = self.jobs.pop(job_id)
+            if job.path:
+                try:
+                    os.remove(job.path)
+                except FileNotFoundError:
+                    pass
+
+    # Function to forget a session's jobs and delete their audio files
+    def clear_session(self, session_id):
+        with self.lock:
+            for job_id in [job_id for job_id, job in self.jobs.items() if job.session_id == session_id]:
+                del self.jobs[job_id]
+        session_dir = os.path.join(self.output_dir, session_id)
+        if os.path.isdir(session_dir):
+            shutil.rmtree(session_dir, ignore_errors=True)
+            return True
+        return False
+
+    # Function to delete session folders left over from old runs
+    def purge(self, max_age):
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.output_dir):
+            path = os.path.join(self.output_dir, name)
+            if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)